@@ -49,6 +49,7 @@ with types.
       url='http://www.acooke.org/pytyp/',
       packages=['pytyp', 'pytyp.spec', 'pytyp.s11n'],
       package_dir = {'':'src'},
+      python_requires='>=3.6',
       keywords = "parser",
       classifiers=['Development Status :: 4 - Beta',
                    'Intended Audience :: Developers',
@@ -57,11 +58,10 @@ with types.
                    'Natural Language :: English',
                    'Operating System :: OS Independent',
                    'Programming Language :: Python :: 3',
-                   'Programming Language :: Python :: 3.0',
-                   'Programming Language :: Python :: 3.1',
-                   'Programming Language :: Python :: 3.2',
-                   'Programming Language :: Python :: 3.3',
-                   'Programming Language :: Python :: 3.4',
+                   'Programming Language :: Python :: 3.6',
+                   'Programming Language :: Python :: 3.7',
+                   'Programming Language :: Python :: 3.8',
+                   'Programming Language :: Python :: 3.9',
                    'Topic :: Software Development',
                    'Topic :: Software Development :: Libraries',
                    'Topic :: Software Development :: Libraries :: Python Modules',
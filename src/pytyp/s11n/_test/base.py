@@ -27,8 +27,9 @@
 # MPL or the LGPL License.
 
 from unittest import TestCase
-from pytyp.s11n.base import decode, cls_to_rec, cls_to_seq
-from pytyp.spec.abcs import Seq, Opt, Rec, Alt, Cls, ANY
+from pytyp.s11n.base import decode, cls_to_rec, cls_to_seq, make_decoder, \
+    interpreter, IDENTITY, class_plan, encode
+from pytyp.spec.abcs import Seq, Opt, Rec, Alt, Cls, ANY, Or, Delayed, normalize
 
 
 class Simple:
@@ -155,6 +156,46 @@ class RewriteTest(TestCase):
         self.assert_decode({'a':1, 'b':2}, Alt(SimpleXY, Simple), Simple(1,2))
 
 
+class PlanTest(TestCase):
+    
+    def assert_same(self, data, spec):
+        results = []
+        for decoder in (make_decoder(spec), 
+                        lambda data: interpreter()(data, normalize(spec))):
+            try:
+                result = decoder(data)
+                results.append((type(result), getattr(result, '__dict__', result)))
+            except TypeError as e:
+                results.append(str(e))
+        assert results[0] == results[1], results
+    
+    def test_interpreter(self):
+        self.assert_same([1, 2], Seq(int))
+        self.assert_same([1, 'a'], Rec(int, str))
+        self.assert_same({'a': 1, 'b': 2}, Rec(a=int, __=int))
+        self.assert_same({'a': 1}, Rec(a=int, b=int))
+        self.assert_same({'a': 1, 'c': 2}, Rec(a=int))
+        self.assert_same([[1, 2], None], Seq(Opt(Simple)))
+        self.assert_same({'x': 1}, Alt(Simple, SimpleXY))
+        self.assert_same(3, Alt(Simple, SimpleXY))
+        self.assert_same({'a': 1, 'b': 2}, Or(Simple, Rec(a=int)))
+        self.assert_same([['one', 'two'], {'a':1, 'b':2}], SimpleNested)
+        self.assert_same({'a': 1, 'x': 2}, SimpleTypedKArgs)
+        
+    def test_cached(self):
+        assert make_decoder([Simple]) is make_decoder(Seq(Simple))
+        assert make_decoder(int) is IDENTITY
+        assert make_decoder(ANY) is IDENTITY
+        
+    def test_delayed(self):
+        tree = Delayed()
+        decoder = make_decoder(Seq(tree))
+        tree.set(Alt(leaf=int, node=Rec(left=tree, right=tree)))
+        data = [{'left': 1, 'right': {'left': 2, 'right': 3}}]
+        assert decoder(data) == data, decoder(data)
+        self.assert_same(data, Seq(tree))
+
+
 class ClsToRecTest(TestCase):
     
     def assert_convert(self, cls, target, convert=cls_to_rec):
@@ -175,3 +216,32 @@ class ClsToRecTest(TestCase):
         self.assert_convert(Cls(Simple), Rec(ANY,ANY), cls_to_seq)
         self.assert_convert(Cls(SimpleTyped), Rec(int,str), cls_to_seq)
         self.assert_convert(Cls(SimpleArgs), Rec(ANY,__=ANY), cls_to_seq)
+
+
+class ClassPlanTest(TestCase):
+    
+    def test_cached(self):
+        assert class_plan(Simple) is class_plan(Simple)
+        assert class_plan(Simple).args == ('a', 'b')
+        assert cls_to_rec(Cls(Simple)) is cls_to_rec(Cls(Simple))
+        
+    def test_invalidate(self):
+        
+        class Changing:
+            def __init__(self, a):
+                self.a = a
+                self.b = None
+                
+        assert encode(Changing(1)) == {'a': 1}
+        assert decode({'a': 1}, Changing).a == 1
+        plan = class_plan(Changing)
+        
+        def __init__(self, a, b):
+            self.a = a
+            self.b = b
+        Changing.__init__ = __init__
+        
+        assert class_plan(Changing) is not plan
+        assert cls_to_rec(Cls(Changing)) == Rec(a=ANY, b=ANY)
+        assert encode(Changing(1, 2)) == {'a': 1, 'b': 2}
+        assert decode({'a': 1, 'b': 2}, Changing).b == 2
@@ -0,0 +1,245 @@
+# The contents of this file are subject to the Mozilla Public License
+# (MPL) Version 1.1 (the "License"); you may not use this file except
+# in compliance with the License. You may obtain a copy of the License
+# at http://www.mozilla.org/MPL/
+#
+# Software distributed under the License is distributed on an "AS IS"
+# basis, WITHOUT WARRANTY OF ANY KIND, either express or implied. See
+# the License for the specific language governing rights and
+# limitations under the License.
+#
+# The Original Code is Pytyp (http://www.acooke.org/pytyp)
+# The Initial Developer of the Original Code is Andrew Cooke.
+# Portions created by the Initial Developer are Copyright (C) 2011
+# Andrew Cooke. All Rights Reserved.
+#
+# Alternatively, the contents of this file may be used under the terms
+# of the LGPL license (the GNU Lesser General Public License,
+# http://www.gnu.org/licenses/lgpl.html), in which case the provisions
+# of the LGPL License are applicable instead of those above.
+#
+# If you wish to allow use of your version of this file only under the
+# terms of the LGPL License and not to allow others to use your version
+# of this file under the MPL, indicate your decision by deleting the
+# provisions above and replace them with the notice and other provisions
+# required by the LGPL License.  If you do not delete the provisions
+# above, a recipient may use your version of this file under either the
+# MPL or the LGPL License.
+
+from copy import copy, deepcopy
+from os.path import join
+from pickle import dumps, loads
+from tempfile import TemporaryDirectory
+from threading import Lock
+from unittest import TestCase
+
+from pytyp._test.support import SimpleArgs, NamedArgs, TypedArgs, Config, \
+    User, Permission, TypedKArgs
+from pytyp.s11n.base import EncodeError, DecodeError
+from pytyp.s11n.binary import record_codec, make_dumps, make_loads
+from pytyp.s11n.json import dumps as json_dumps
+from pytyp.spec.abcs import Alt, Opt, Rec, Delayed, ANY
+from pytyp.spec.record import record
+
+
+Inner = record('Inner', 'x:float,y:float')
+Outer = record('Outer', 'a:int,b:str,c:bool,d:Inner,e=None,__:int',
+               context={'Inner': Inner})
+Interned = record('Interned', 'a:int,b:bytes', intern=True)
+
+
+class RecordCodecTest(TestCase):
+    
+    def test_roundtrip(self):
+        outer = Outer(1, 'two', True, Inner(1.5, 2.5), [3], f=4)
+        codec = record_codec(Outer)
+        data = codec.encode(outer)
+        result = codec.decode(data)
+        assert result == outer, result
+        assert type(result['d']) is Inner
+        assert b'two' in data and b'"a"' not in data
+        
+    def test_size(self):
+        inner = Inner(1.5, 2.5)
+        assert len(record_codec(Inner).encode(inner)) < len(dumps(dict(inner)))
+        
+    def test_mismatch(self):
+        codec = record_codec(Outer)
+        try:
+            codec.encode(Outer._build(dict(a='one', b='two', c=True, d=None, e=None)))
+            assert False, 'Expected error'
+        except EncodeError:
+            pass
+        
+    def test_pickle(self):
+        outer = Outer(1, 'two', False, Inner(1.5, 2.5), e={'x': 1})
+        assert loads(dumps(outer)) == outer
+        assert copy(outer) == outer
+        big = Outer(2**70, 'two', False, Inner(1.5, 2.5))
+        assert loads(dumps(big)) == big
+        
+    def test_copy(self):
+        outer = Outer(1, 'two', False, Inner(1.5, 2.5), e=[1])
+        shallow = copy(outer)
+        assert shallow == outer and shallow is not outer
+        assert shallow['e'] is outer['e']
+        deep = deepcopy(outer)
+        assert deep == outer and deep['e'] is not outer['e']
+        assert type(deep['d']) is Inner
+        lock = Outer(1, 'two', False, Inner(1.5, 2.5), e=Lock())
+        assert copy(lock)['e'] is lock['e']
+        try:
+            dumps(lock)
+            assert False, 'Expected error'
+        except TypeError:
+            pass
+        
+    def test_codec_bug(self):
+        # only expected errors fall back to a dict
+        outer = Outer(1, 'two', False, Inner(1.5, 2.5))
+        codec = record_codec(Outer)
+        def broken(record): raise RuntimeError('bug')
+        codec.encode = broken
+        try:
+            dumps(outer)
+            assert False, 'Expected error'
+        except RuntimeError:
+            pass
+        finally:
+            del codec.encode
+        assert loads(dumps(outer)) == outer
+        
+    def test_intern(self):
+        interned = Interned(1, b'one')
+        assert loads(dumps(interned)) is interned
+
+
+class Varargs:
+    
+    def __init__(self, a:int, *b:[str]):
+        self.a = a
+        self.b = b
+        
+    def __eq__(self, other):
+        return type(other) is Varargs and (self.a, self.b) == (other.a, other.b)
+    
+
+class OnlyVarargs:
+    
+    def __init__(self, *args:[Varargs]):
+        self.args = args
+        
+    def __eq__(self, other):
+        return type(other) is OnlyVarargs and self.args == other.args
+    
+
+class SpecCodecTest(TestCase):
+    
+    def assert_roundtrip(self, spec, value, target=None):
+        if target is None: target = value
+        data = make_dumps(spec)(value)
+        result = make_loads(spec)(data)
+        assert result == target, (result, target, data)
+        return data
+        
+    def test_atomic(self):
+        for value in (0, 1, -1, 63, -64, 64, 2**70, -2**70):
+            self.assert_roundtrip(int, value)
+        assert len(make_dumps(int)(-64)) == 1
+        self.assert_roundtrip(float, -1.5)
+        self.assert_roundtrip(bool, True)
+        self.assert_roundtrip(str, 'caf\xe9')
+        self.assert_roundtrip(bytes, b'\x00\xff')
+        
+    def test_structure(self):
+        self.assert_roundtrip([int], (1, -2, 3), [1, -2, 3])
+        self.assert_roundtrip((int, str), [1, 'a'], (1, 'a'))
+        self.assert_roundtrip(Opt([str]), None)
+        self.assert_roundtrip(Opt([str]), ['a'])
+        self.assert_roundtrip(Alt(int, str, [int]), 'a')
+        self.assert_roundtrip(Alt(int, str, [int]), [1])
+        spec = {'a': int, '__b': str, '__c': float}
+        self.assert_roundtrip(spec, {'a': 1})
+        self.assert_roundtrip(spec, {'a': 1, 'c': 2.0})
+        self.assert_roundtrip(Rec(a=int, __=[int]), {'a': 1, 'b': [2], 'c': []})
+        
+    def test_any(self):
+        value = [None, True, 1, 2.5, 'a', b'b', {'c': [1, (2,)]}, NamedArgs(1, 2)]
+        target = [None, True, 1, 2.5, 'a', b'b', {'c': [1, [2]]}, {'p': 1, 'q': 2}]
+        self.assert_roundtrip(ANY, value, target)
+        self.assert_roundtrip({'x': list}, {'x': value}, {'x': target})
+        
+    def test_classes(self):
+        config = Config([User('bob', 'bob@example.com'), User('andrew', 'andrew@acooke.org')],
+                        Permission('foo.txt', 'rw'))
+        result = make_loads(Config)(make_dumps(Config)(config))
+        assert [user.name for user in result.users] == ['bob', 'andrew']
+        assert result.permission.rw == 'rw'
+        self.assert_roundtrip(TypedArgs, TypedArgs(NamedArgs(1, 2), SimpleArgs(1, 'b', None)))
+        self.assert_roundtrip(TypedArgs, TypedArgs(NamedArgs(1, 2), None))
+        self.assert_roundtrip(TypedKArgs, TypedKArgs(foo=SimpleArgs(1, 2, 3)))
+        self.assert_roundtrip([Varargs], [Varargs(1), Varargs(2, 'a', 'b')])
+        self.assert_roundtrip(OnlyVarargs, OnlyVarargs(Varargs(1), Varargs(2, 'a')))
+        self.assert_roundtrip(OnlyVarargs, OnlyVarargs())
+        outer = Outer(1, 'two', True, Inner(1.5, 2.5), [3], f=4)
+        self.assert_roundtrip(Opt(Outer), outer)
+        
+    def test_delayed(self):
+        tree = Delayed()
+        tree.set(Alt(leaf=int, node=[tree]))
+        self.assert_roundtrip(tree, [1, [2, [3]], []])
+        
+    def test_size(self):
+        data = [TypedArgs(NamedArgs(i, str(i)), None) for i in range(100)]
+        binary = make_dumps([TypedArgs])(data)
+        assert len(binary) * 4 < len(json_dumps(data)), len(binary)
+        
+    def test_errors(self):
+        for (spec, value) in ((int, 1.0), (int, True), ({'a': int}, {'b': 1}),
+                              ({'a': int}, {'a': 1, 'b': 2}), (Alt(int, str), None),
+                              ((int, str), [1]), (NamedArgs, SimpleArgs(1, 2, 3))):
+            try:
+                make_dumps(spec)(value)
+                assert False, 'Expected error for {}'.format(value)
+            except EncodeError:
+                pass
+        loads = make_loads([str])
+        for data in (b'\x02\x01a', b'\x01\x01a\x00', b'\x01\x01\xff'):
+            try:
+                loads(data)
+                assert False, 'Expected error for {}'.format(data)
+            except DecodeError:
+                pass
+        try:
+            loads(b'\x01\x05ab')
+            assert False, 'Expected error'
+        except DecodeError as e:
+            assert 'Truncated' in str(e), e
+        class Picky:
+            def __init__(self, x:int):
+                if x > 10: raise TypeError('too big')
+        try:
+            make_loads(Picky)(make_dumps({'x': int})({'x': 11}))
+            assert False, 'Expected error'
+        except DecodeError as e:
+            assert isinstance(e.__cause__, TypeError), e
+            
+    def test_sources(self):
+        spec = [Alt(int, str, bytes)]
+        value = [1, 'two', b'three']
+        data = make_dumps(spec)(value)
+        loads = make_loads(spec)
+        assert loads(bytearray(data)) == value
+        assert loads(memoryview(data)) == value
+        with TemporaryDirectory() as directory:
+            path = join(directory, 'data.bin')
+            with open(path, 'wb') as output:
+                output.write(data)
+            assert loads(path) == value
+            with open(path, 'wb') as output:
+                output.write(data[:-1])
+            try:
+                loads(path)
+                assert False, 'Expected error'
+            except DecodeError:
+                pass
@@ -29,7 +29,7 @@
 from unittest import TestCase
 
 from pytyp._test.support import SimpleArgs
-from pytyp.s11n.base import Encoder, EncodeError
+from pytyp.s11n.base import Encoder, EncodeError, class_plan
 
 
 class Example():
@@ -86,3 +86,77 @@ class EncodeTest(TestCase):
             assert False, 'Expected error'
         except EncodeError as e:
             assert 'Circular' in str(e), e
+            
+    def test_circular_depth(self):
+        for depth in (0, 1, 3, 10):
+            encode = Encoder(circular_depth=depth)
+            s = SimpleArgs(1, [2], {'a': 3})
+            s.c['b'] = [s]
+            try:
+                encode([s])
+                assert False, 'Expected error'
+            except EncodeError as e:
+                assert 'Circular' in str(e), e
+            # state is reset after an error
+            s.c['b'] = [1, 1]
+            s.b = [s.c, s.c]
+            c = {'a': 3, 'b': [1, 1]}
+            assert encode([s, s]) == [{'a': 1, 'b': [c, c], 'c': c}] * 2
+            assert encode._depth == 0 and not encode._check
+
+    def test_attributes(self):
+        
+        class Slots:
+            __slots__ = ('a', 'b')
+            def __init__(self, a, b):
+                self.a = a
+                self.b = b
+                
+        class Property:
+            def __init__(self, a, b):
+                self._a = a
+                self.b = b
+            @property
+            def a(self):
+                return self._a + 1
+            
+        class Missing:
+            def __init__(self, a):
+                pass
+            def __getattr__(self, name):
+                return name
+            
+        self.assert_encode(Slots(1, [2]), {'a': 1, 'b': [2]})
+        self.assert_encode(Property(1, 2), {'a': 2, 'b': 2})
+        self.assert_encode(Missing(1), {'a': 'a'})
+        self.assert_encode(None)
+        
+    def test_plans(self):
+        assert class_plan(int).kind == 'atomic'
+        assert class_plan(dict).kind == 'map'
+        assert class_plan(tuple).kind == 'list'
+        plan = class_plan(Example)
+        assert plan.kind == 'object'
+        assert plan.values(Example(1)) == (1,)
+        
+    def test_method(self):
+        
+        class Method:
+            def __init__(self, run):
+                pass
+            def run(self):
+                pass
+            
+        try:
+            Encoder()(Method(None))
+            assert False, 'Expected error'
+        except TypeError as e:
+            assert 'run' in str(e), e
+            
+    def test_events(self):
+        events = list(Encoder().events([Container(Example(1)), {'a': None}]))
+        assert events == [('list', None), 
+                          ('list', None), ('map', None), ('key', 'foo'), ('atomic', 1), 
+                          ('end', None), ('end', None), 
+                          ('map', None), ('key', 'a'), ('atomic', None), ('end', None), 
+                          ('end', None)], events
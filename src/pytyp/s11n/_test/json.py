@@ -28,19 +28,30 @@
 
 from unittest import TestCase
 
-from pytyp.s11n.json import make_JSONDecoder, JSONEncoder
+from io import StringIO, BytesIO
+from json import JSONDecodeError, dumps
+from os.path import join
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+from pytyp.s11n.json import make_JSONDecoder, JSONEncoder, make_loads, make_load, \
+    make_iterload, make_load_lines, dump_lines, decode_many, dumps_parallel, \
+    dump_parallel, make_dumps, make_dump, iterencode, dump_iter
+from pytyp.s11n.json import dumps as dumps_
+from pytyp.s11n.base import DecodeError, EncodeError
 from pytyp._test.support import SimpleArgs, NamedArgs, MixedArgs, TypedArgs, \
-    Config, User, Permission
-from pytyp.spec.abcs import Alt
+    Config, User, Permission, ArgsAndKArgs, TypedKArgs
+from pytyp.spec.abcs import Alt, Rec, Opt, Seq, Delayed
 from pytyp.spec.record import record
 
 
 class JSONDecoderTest(TestCase):
     
     def assert_decode(self, type_, value, target):
-        JSONDecoder = make_JSONDecoder(type_)
-        result = JSONDecoder().decode(value)
-        assert result == target, result 
+        for single_pass in (False, True):
+            JSONDecoder = make_JSONDecoder(type_, single_pass=single_pass)
+            result = JSONDecoder().decode(value)
+            assert result == target, result 
         return result
     
     def test_native(self):
@@ -67,10 +78,375 @@ class JSONDecoderTest(TestCase):
         assert r.a == 1
         
 
+class SinglePassTest(TestCase):
+    
+    def assert_same(self, spec, value):
+        results = []
+        for single_pass in (False, True):
+            try:
+                result = make_loads(spec, single_pass=single_pass)(value)
+                results.append((type(result), getattr(result, '__dict__', result)))
+            except (TypeError, IndexError, ValueError) as e:
+                results.append(type(e))
+        assert results[0] == results[1], results
+        
+    def test_structure(self):
+        self.assert_same(Seq(Rec(a=int, __b=str)), ' [ {"a" : 1 } ,{"b":"x", "a":2}] ')
+        self.assert_same(Seq(Rec(a=int, __b=str)), '[]')
+        self.assert_same(Rec(a=int), '{}')
+        self.assert_same(Rec(a=int), '{"a": 1, "c": [1, {}]}')
+        self.assert_same(Rec(int, str), '[1, "two"]')
+        self.assert_same(Rec(int, str), '[1]')
+        self.assert_same(Rec(__=int), '{"x": {"y": 1}}')
+        self.assert_same([Opt(NamedArgs)], '[null, {"p": 1, "q": [2]}]')
+        self.assert_same(SimpleArgs, '[1, 2, 3, 4]')
+        self.assert_same(TypedArgs, '{"x": {"q": 2, "p": 1}}')
+        
+    def test_delayed(self):
+        tree = Delayed()
+        tree.set(Alt(leaf=int, node=Rec(left=tree, right=tree)))
+        self.assert_same(Seq(tree), '[1, {"left": {"left": 2, "right": 3}, "right": 4}]')
+        self.assert_same(Rec(a=tree), '{"a": {"left": 2, "right": 3}}')
+        
+    def test_syntax(self):
+        loads = make_loads(Seq(Rec(a=int)), single_pass=True)
+        for bad in ('[{"a": 1}', '[{"a" 1}]', '[{a: 1}]', '[{"a": 1} {"a": 2}]',
+                    '[{"a": }]', '[{"a": 1},]', '[{"a": 1}] x'):
+            try:
+                loads(bad)
+                assert False, 'Expected error: ' + bad
+            except JSONDecodeError:
+                pass
+            
+    def test_error_position(self):
+        good = '[' + ',\n'.join(map(str, range(1000)))
+        for (bad, msg) in ((good + ',\n x]', 'Expecting value'),
+                           (good + '\n x]', "Expecting ',' delimiter"),
+                           (good + ']\n x', 'Extra data'),
+                           (good.replace('\n', ' ') + ' x]', "Expecting ',' delimiter")):
+            whole = JSONDecodeError(msg, bad, bad.index('x'))
+            for chunk_size in (1, 3, 16):
+                try:
+                    list(make_iterload([int], chunk_size=chunk_size)(StringIO(bad)))
+                    assert False, 'Expected error'
+                except JSONDecodeError as err:
+                    assert err.msg == msg, err
+                    assert (err.pos, err.lineno, err.colno) == \
+                        (whole.pos, whole.lineno, whole.colno), (chunk_size, err)
+                    assert str(err) == str(whole), err
+            
+    def test_malformed(self):
+        # errors in decoding are reported as syntax errors if the input is bad
+        for (spec, bad, pos) in ((Seq(Seq(NamedArgs)), '[{"p": 1, "q": 2}', 17),
+                                 (Seq(Rec(int, str)), '[[1]', 4),
+                                 (Rec(a=Seq(int)), '{"a": ["x"', 10),
+                                 (Seq(SimpleArgs), '[{"a": 1}}', 9)):
+            try:
+                make_loads(spec, single_pass=True)(bad)
+                assert False, 'Expected error: ' + bad
+            except JSONDecodeError as e:
+                assert e.pos == pos, (bad, e.pos)
+        try:
+            make_loads(Seq(Seq(NamedArgs)), single_pass=True)('[{"p": 1, "q": 2}]')
+            assert False, 'Expected error'
+        except JSONDecodeError:
+            assert False, 'Unexpected syntax error'
+        except (TypeError, IndexError):
+            pass
+        
+
+class IterLoadTest(TestCase):
+    
+    def assert_iterload(self, spec, text, target, **kargs):
+        for chunk_size in (1, 3, 1000):
+            for single_pass in (False, True):
+                iterload = make_iterload(spec, chunk_size=chunk_size, 
+                                         single_pass=single_pass)
+                result = list(iterload(StringIO(text)))
+                assert result == target, result
+                result = list(iterload(BytesIO(text.encode('utf8'))))
+                assert result == target, result
+                result = list(iterload(memoryview(text.encode('utf8'))))
+                assert result == target, result
+        with TemporaryDirectory() as directory:
+            path = join(directory, 'data.json')
+            with open(path, 'w', encoding='utf8') as output:
+                output.write(text)
+            result = list(make_iterload(spec, chunk_size=2)(path))
+            assert result == target, result
+        
+    def test_array(self):
+        self.assert_iterload(Seq(int), ' [ 123, 4 ,56789 ] ', [123, 4, 56789])
+        self.assert_iterload(Seq(int), '[]', [])
+        self.assert_iterload([str], '["\u00e9t\u00e9", "été"]', ['été', 'été'])
+        self.assert_iterload([NamedArgs], '[{"p": 1, "q": 22222}, {"p": [1, 2], "q": {}}]', 
+                             [NamedArgs(1, 22222), NamedArgs([1, 2], {})])
+        
+    def test_stream(self):
+        self.assert_iterload(NamedArgs, '{"p": 1, "q": 2}\n{"p": 3, "q": 4}', 
+                             [NamedArgs(1, 2), NamedArgs(3, 4)])
+        self.assert_iterload(int, '1 22 333\n4444', [1, 22, 333, 4444])
+        self.assert_iterload(int, '', [])
+        
+    def test_large(self):
+        data = [{'p': list(range(i)), 'q': 'x' * i} for i in range(100)]
+        iterload = make_iterload([NamedArgs], chunk_size=16)
+        result = list(iterload(StringIO(dumps(data))))
+        assert result == [NamedArgs(**d) for d in data]
+    
+    def test_floats(self):
+        data = [i * 1.25e-7 - 3.5 for i in range(200)] + [1e10, -2.5e-10]
+        for chunk_size in (1, 2, 3, 5, 7, 16):
+            for text in (dumps(data), ' '.join(map(str, data))):
+                result = list(make_iterload([float], chunk_size=chunk_size)(StringIO(text)))
+                assert result == data, (chunk_size, result)
+        
+    def test_errors(self):
+        for bad in ('[1, 2', '[1 2]', '[1, 2] 3', '[1, }', '{"a": 1', '1 2 }'):
+            try:
+                list(make_iterload([int], chunk_size=2)(StringIO(bad)))
+                assert False, 'Expected error: ' + bad
+            except JSONDecodeError:
+                pass
+        
+
+class SourceTest(TestCase):
+    
+    def test_load(self):
+        load = make_load([NamedArgs])
+        text = '[{"p": "\u00e9t\u00e9", "q": 2}]'
+        target = [NamedArgs('été', 2)]
+        for data in (text.encode('utf8'), bytearray(text.encode('utf-16')), 
+                     memoryview(text.encode('utf-8-sig'))):
+            assert load(data) == target, data
+        with TemporaryDirectory() as directory:
+            path = join(directory, 'data.json')
+            with open(path, 'w', encoding='utf8') as output:
+                output.write(text)
+            assert load(path) == target
+            assert load(Path(path)) == target
+            
+            
+class LinesTest(TestCase):
+    
+    def test_roundtrip(self):
+        data = [NamedArgs(i, 'x' * i) for i in range(50)]
+        out = StringIO()
+        dump_lines(data, out, buffer_size=100)
+        text = out.getvalue()
+        assert text.count('\n') == 50, text
+        result = list(make_load_lines(NamedArgs)(StringIO(text)))
+        assert result == data, result
+        result = list(make_load_lines(NamedArgs)(BytesIO(text.encode('utf8'))))
+        assert result == data, result
+        
+    def test_buffered(self):
+        writes = []
+        class Out:
+            def write(self, text): writes.append(text)
+        dump_lines(range(1000), Out(), buffer_size=1000)
+        assert 1 < len(writes) < 10, len(writes)
+        assert ''.join(writes) == ''.join('{}\n'.format(i) for i in range(1000))
+        
+    def test_errors(self):
+        text = '{"p": 1, "q": 2}\n{"x": 1}\nnot json\n{"p": 3, "q": 4}\n'
+        try:
+            list(make_load_lines(NamedArgs)(StringIO(text)))
+            assert False, 'Expected error'
+        except TypeError:
+            pass
+        errors = []
+        load_lines = make_load_lines(NamedArgs, skip_errors=True, 
+                                     on_error=lambda *args: errors.append(args))
+        result = list(load_lines(StringIO(text)))
+        assert result == [NamedArgs(1, 2), NamedArgs(3, 4)], result
+        assert [n for (n, _, _) in errors] == [2, 3], errors
+        assert isinstance(errors[1][2], JSONDecodeError), errors
+        try:
+            dump_lines([1], StringIO(), indent=2)
+            assert False, 'Expected error'
+        except ValueError:
+            pass
+        
+    def test_constructor_errors(self):
+        class Fragile:
+            def __init__(self, x:int):
+                [][x]
+        text = '{"x": 1}\n{"x": "one"}\n'
+        errors = []
+        load_lines = make_load_lines(Fragile, skip_errors=True, 
+                                     on_error=lambda *args: errors.append(args))
+        assert list(load_lines(StringIO(text))) == []
+        assert [n for (n, _, _) in errors] == [1, 2], errors
+        assert isinstance(errors[0][2], DecodeError), errors
+        assert isinstance(errors[0][2].__cause__, IndexError), errors
+        try:
+            list(make_load_lines(Fragile)(StringIO(text)))
+            assert False, 'Expected error'
+        except DecodeError:
+            pass
+
+
+class DumpIterTest(TestCase):
+    
+    def test_layout(self):
+        data = [NamedArgs(i, {'x': [i]}) for i in range(5)]
+        for kargs in ({}, {'indent': 2}, {'indent': '\t', 'sort_keys': True}, 
+                      {'separators': (',', ':')}, {'indent': 0}):
+            for values in (data, data[:1], []):
+                for (spec, buffer_size) in ((None, 65536), ([NamedArgs], 10)):
+                    out = StringIO()
+                    dump_iter(iter(values), out, spec=spec, 
+                              buffer_size=buffer_size, **kargs)
+                    assert out.getvalue() == dumps_(values, **kargs), out.getvalue()
+                    
+    def test_buffered(self):
+        
+        class Writes(StringIO):
+            count = 0
+            def write(self, text):
+                self.count += 1
+                return super().write(text)
+            
+        out = Writes()
+        dump_iter((NamedArgs(i) for i in range(100)), out, spec=NamedArgs,
+                  buffer_size=500)
+        assert 1 < out.count < 10, out.count
+        assert out.getvalue() == dumps_([NamedArgs(i) for i in range(100)])
+
+
+class DecodeManyTest(TestCase):
+    
+    def test_parallel(self):
+        documents = ['{{"p": {0}, "q": [{0}]}}'.format(i) for i in range(20)]
+        target = [NamedArgs(i, [i]) for i in range(20)]
+        for workers in (1, 2):
+            result = decode_many(documents, NamedArgs, workers=workers, chunksize=3)
+            assert result == target, result
+            result = decode_many(iter(documents), Opt(NamedArgs), 
+                                 workers=workers, chunksize=3, single_pass=True)
+            assert result == target, result
+        
+    def test_lines(self):
+        documents = ['1\n2\n', '3\n\n4', '5']
+        result = decode_many(documents, int, workers=2, chunksize=1, lines=True)
+        assert result == [1, 2, 3, 4, 5], result
+        assert decode_many([], int) == []
+        
+    def test_unportable(self):
+        
+        class Local:
+            def __init__(self, a):
+                self.a = a
+                
+        assert decode_many(['{"a": 1}'], Local)[0].a == 1
+        tree = Delayed()
+        tree.set(Alt(leaf=int, node=[tree]))
+        for spec in (Local, [Local], tree):
+            try:
+                decode_many(['{"a": 1}', '{"a": 2}'], spec, workers=2, chunksize=1)
+                assert False, 'Expected error'
+            except DecodeError:
+                pass
+
+
+class DumpsParallelTest(TestCase):
+    
+    def test_layout(self):
+        data = [NamedArgs(i, {'x': [i]}) for i in range(25)]
+        for kargs in ({}, {'indent': 2}, {'indent': '\t', 'sort_keys': True}, 
+                      {'separators': (',', ':')}, {'indent': 0}):
+            result = dumps_parallel(data, workers=2, chunksize=4, **kargs)
+            assert result == dumps_(data, **kargs), result
+        out = StringIO()
+        dump_parallel(tuple(data), out, workers=2, chunksize=7)
+        assert out.getvalue() == dumps_(data), out.getvalue()
+        
+    def test_serial(self):
+        
+        class Local:
+            def __init__(self, a):
+                self.a = a
+                
+        assert dumps_parallel([Local(1)], chunksize=1) == '[{"a": 1}]'
+        assert dumps_parallel({'a': 1}) == '{"a": 1}'
+        try:
+            dumps_parallel([Local(1), Local(2)], workers=2, chunksize=1)
+            assert False, 'Expected error'
+        except EncodeError:
+            pass
+
+
+class IterEncodeTest(TestCase):
+    
+    def test_chunks(self):
+        data = [TypedArgs(NamedArgs(i, [i]), SimpleArgs(1, 2, {'a': i})) for i in range(3)]
+        for kargs in ({}, {'indent': 2, 'sort_keys': True}):
+            chunks = list(iterencode(data, **kargs))
+            assert len(chunks) > 1, chunks
+            assert ''.join(chunks) == dumps_(data, **kargs), chunks
+            
+            
+class MakeDumpsTest(TestCase):
+    
+    def assert_dumps(self, spec, value):
+        result = make_dumps(spec)(value, sort_keys=True)
+        assert result == dumps_(value, sort_keys=True), result
+        out = StringIO()
+        make_dump(spec)(value, out, sort_keys=True)
+        assert out.getvalue() == result, out.getvalue()
+        
+    def test_classes(self):
+        config = Config([User('bob', 'bob@example.com')], Permission('foo.txt', 'r'))
+        self.assert_dumps(Config, config)
+        self.assert_dumps([Config], (config, config))
+        self.assert_dumps({'a': TypedArgs, 'b': Opt(NamedArgs)}, 
+                          {'a': TypedArgs(NamedArgs(1, [2]), None), 'b': None, 'c': 3})
+        self.assert_dumps(TypedKArgs, TypedKArgs(foo=SimpleArgs(1, 2, 3), bar=4))
+        
+    def test_varargs(self):
+        
+        class Varargs:
+            def __init__(self, a, *b:[SimpleArgs]):
+                self.a = a
+                self.b = b
+                
+        self.assert_dumps(Varargs, Varargs(1, SimpleArgs(1, 2, 3)))
+        
+    def test_mismatch(self):
+        # values that do not match the spec are encoded generically
+        self.assert_dumps([int], [1, 2.0, NamedArgs(1, 2)])
+        self.assert_dumps(Config, {'users': [NamedArgs(1, 2)], 'permission': 'all'})
+        self.assert_dumps(Opt(SimpleArgs), NamedArgs(1, 2))
+        
+    def test_errors(self):
+        dumps = make_dumps(ArgsAndKArgs)
+        try:
+            dumps(ArgsAndKArgs(SimpleArgs(1, 2, 3), a=1))
+            assert False, 'Expected error'
+        except EncodeError:
+            pass
+        
+        class Method:
+            def __init__(self, run):
+                pass
+            def run(self):
+                pass
+            
+        try:
+            make_dumps(Method)(Method(None))
+            assert False, 'Expected error'
+        except TypeError as e:
+            assert 'run' in str(e), e
+        
+        
 class ConfigTest(TestCase):
     
     def test_config(self):
-        JSONDecoder = make_JSONDecoder(Config)
+        for single_pass in (False, True):
+            self.assert_config(make_JSONDecoder(Config, single_pass=single_pass))
+        
+    def assert_config(self, JSONDecoder):
         config = JSONDecoder().decode('''
 {"users": [
  {"name": "bob",
@@ -28,9 +28,17 @@
 
 from unittest import TestCase
 
+from io import StringIO
+from os.path import join
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+from yaml import safe_dump
+
 from pytyp._test.support import SimpleArgs, NamedArgs, MixedArgs, TypedArgs, \
     Config, User, Permission
-from pytyp.s11n.yaml import dump, make_load
+from pytyp.s11n.base import encode, EncodeError
+from pytyp.s11n.yaml import dump, make_load, make_load_all, dump_stream
 
 
 class DumpTest(TestCase):
@@ -52,6 +60,33 @@ class DumpTest(TestCase):
         self.assert_dump(TypedArgs(NamedArgs(1, 2), SimpleArgs(1, 2, 3)),
                          'x: {p: 1, q: 2}\ny: {a: 1, b: 2, c: 3}\n')
 
+class DumpStreamTest(TestCase):
+    
+    def assert_stream(self, value, **kargs):
+        result = dump_stream(value, **kargs)
+        target = safe_dump(encode(value), sort_keys=False, **kargs)
+        assert result == target, (result, target)
+        
+    def test_stream(self):
+        config = Config([User('bob', 'bob@example.com'), User('andrew', None)], 
+                        Permission(b'foo.txt', True))
+        for kargs in ({}, {'default_flow_style': True}, {'indent': 4}):
+            self.assert_stream(config, **kargs)
+            self.assert_stream([{1: 2.5, 'a': []}, {}, 'abc', '1'], **kargs)
+        out = StringIO()
+        dump_stream(TypedArgs(NamedArgs(1, 2), SimpleArgs(1, 2, 3)), out)
+        assert out.getvalue() == 'x:\n  p: 1\n  q: 2\ny:\n  a: 1\n  b: 2\n  c: 3\n', out.getvalue()
+        
+    def test_circular(self):
+        s = SimpleArgs(1, 2, 3)
+        s.b = [s]
+        try:
+            dump_stream(s)
+            assert False, 'Expected error'
+        except EncodeError as e:
+            assert 'Circular' in str(e), e
+
+
 class LoadTest(TestCase):
 
     def assert_load(self, type_, value, target):
@@ -74,6 +109,22 @@ class LoadTest(TestCase):
                            TypedArgs(NamedArgs(1, 2), SimpleArgs(1, 2, 3)))
 
 
+class SourceTest(TestCase):
+    
+    def test_sources(self):
+        load = make_load(NamedArgs)
+        text = 'p: \u00e9t\u00e9\nq: 2\n'
+        for data in (text.encode('utf8'), bytearray(text.encode('utf-16')),
+                     memoryview(text.encode('utf8'))):
+            assert load(data) == NamedArgs('été', 2), data
+        with TemporaryDirectory() as directory:
+            path = join(directory, 'data.yaml')
+            with open(path, 'w', encoding='utf8') as output:
+                output.write(text + '---\n' + text)
+            assert list(make_load_all([NamedArgs, NamedArgs])(Path(path))) == \
+                [NamedArgs('été', 2)] * 2
+
+
 class ConfigTest(TestCase):
 
     def test_config(self):
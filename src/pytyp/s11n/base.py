@@ -28,10 +28,15 @@
 
 from pprint import pprint
 from collections import Mapping, Sequence, Callable
+from contextlib import contextmanager
 from inspect import getfullargspec
+from mmap import mmap, ACCESS_READ
+from operator import attrgetter, itemgetter
+from weakref import WeakKeyDictionary
 
 from pytyp.spec.dispatch import overload
-from pytyp.spec.abcs import Seq, Sub, Rec, Cls, Opt, Alt, ANY, normalize, Atomic
+from pytyp.spec.abcs import Seq, Sub, Rec, Cls, Opt, Alt, ANY, normalize, Atomic, \
+    Sum, Delayed, NoBacktrack, Atr, And, Or
 
 
 class DecodeError(TypeError): pass
@@ -96,25 +101,475 @@ class Collection(ToList):
         return list(self.item(v, s) for (v, s, _) in vsn)
 
 
-def decode(data, spec):
+def interpreter():
     '''
-    Rewrite the given data so that it conforms to the type specification.
+    Construct the mutually recursive pair used to interpret a spec as data
+    are decoded (compiled plans, below, are faster and used by default).
     '''
-    # construct mutually recursive pair
     collection, item = Collection(), Item()
     collection.item, item.collection = item, collection
-    return item(data, normalize(spec))
+    return item
 
 
-class ClsConverter:
+def decode(data, spec):
+    '''
+    Rewrite the given data so that it conforms to the type specification.
+    '''
+    return make_decoder(spec)(data)
+
+
+def make_decoder(spec):
+    '''
+    Compile the type specification to a plan - a callable that rewrites data
+    in the same way as `decode()`, but with the spec examined once, in
+    advance, rather than for each value.
     
-    def __call__(self, cls):
+      >>> decoder = make_decoder({'a': [int], 'b': Opt(str)})
+      >>> pprint(decoder({'a': (1, 2), 'b': None}))
+      {'a': [1, 2], 'b': None}
+    '''
+    return _item_plan(normalize(spec))
+
+
+# plans are cached by (normalized) spec.  there's no lock; a race simply
+# compiles the same plan twice.
+_item_plans = WeakKeyDictionary()
+_backtrack_plans = WeakKeyDictionary()
+
+def _item_plan(spec):
+    '''
+    The plan for `Item()` - dispatch on value and spec.
+    '''
+    try:
+        return _item_plans[spec]
+    except KeyError:
+        plan = _item_plans[spec] = _compile_item(spec)
+        return plan
+
+def _compile_item(spec):
+    if isinstance(spec, Sub(Cls)):
+        if spec._abc_class in (object, dict, list) or issubclass(spec._abc_class, Atomic):
+            return _backtrack_plan(spec)
+        else:
+            return Construct(spec, _backtrack_plan(spec))
+    elif hasattr(spec, '_backtrack'):
+        return _backtrack_plan(spec)
+    else:
+        return IDENTITY
+    
+def _backtrack_plan(spec):
+    '''
+    The plan for ``spec._backtrack()`` with `Collection()` - dispatch on spec.
+    '''
+    try:
+        return _backtrack_plans[spec]
+    except KeyError:
+        plan = _backtrack_plans[spec] = _compile_backtrack(spec)
+        return plan
+
+def _compile_backtrack(spec):
+    if issubclass(spec, Delayed):
+        return DelayedNode(spec)
+    elif isinstance(spec, Sub(Cls)):
+        if hasattr(spec._abc_class, '_backtrack'):
+            return Interpret(spec)
+        else:
+            return IDENTITY
+    elif hasattr(spec, '_abc_type_arguments'):
+        if isinstance(spec, Sub(Rec)):
+            return RecNode(spec)
+        elif isinstance(spec, Sub(Seq)):
+            return SeqNode(spec)
+        elif issubclass(spec, Sum):
+            return SumNode(spec)
+    elif isinstance(spec, Sub(Seq)):
+        return SeqNode(spec)
+    return Interpret(spec)
+
+
+class Identity:
+    '''
+    Return the data unchanged.
+    '''
+    
+    def __call__(self, value):
+        return value
+    
+IDENTITY = Identity()
+    
+
+class Construct(ToList):
+    '''
+    Call a class constructor with arguments from a list or dict (which are
+    described by the specs from `cls_to_seq()` or `cls_to_rec()`).  Other 
+    values are passed to ``fallback``.
+    '''
+    
+    def __init__(self, spec, fallback):
+        self.spec = spec
+        self.cls = spec._abc_class
+        self.fallback = fallback
+        # compiled on first use (only then are errors for unsuitable 
+        # classes raised) and discarded if the constructor changes
+        self._init = None
+        self._seq = None
+        self._rec = None
+        
+    def _check_init(self):
+        if self.cls.__init__ is not self._init:
+            self._init = self.cls.__init__
+            self._seq = self._rec = None
+        
+    @property
+    def seq(self):
+        self._check_init()
+        if self._seq is None:
+            self._seq = _backtrack_plan(cls_to_seq(self.spec))
+        return self._seq
+
+    @property
+    def rec(self):
+        self._check_init()
+        if self._rec is None:
+            self._rec = _backtrack_plan(cls_to_rec(self.spec))
+        return self._rec
+
+    def __call__(self, value):
+        if isinstance(value, Sequence):
+            return self.cls(*list(self.to_list(self.seq(value))))
+        elif isinstance(value, Mapping):
+            return self.cls(**self.rec(value))
+        else:
+            return self.fallback(value)
+    
+
+class RecNode(ToList):
+    '''
+    Decode the contents of a record (as `Collection.rec()`).
+    '''
+    
+    def __init__(self, spec):
+        self.spec = spec
+        self.fields = []
+        self.default = None
+        for (key, field_spec) in spec._abc_type_arguments:
+            name = Rec.OptKey.unpack(key)
+            if name:
+                self.fields.append((name, key, isinstance(key, Rec.OptKey),
+                                    _item_plan(field_spec)))
+            else:
+                self.default = _item_plan(field_spec)
+        self.plans = dict((name, plan) for (name, _, _, plan) in self.fields)
+        self.int_keys = spec._int_keys()
+        
+    def child(self, name):
+        '''
+        The plan for the named (or indexed) value, or ``None`` if the name 
+        is not expected.  For parsers that decode values as they are read
+        (see `complete()`).
+        '''
+        return self.plans.get(name, self.default)
+    
+    def complete(self, result, extras, from_list=False):
+        '''
+        Check and return ``result``, a dict of values already decoded by the
+        plans from `child()`.  ``extras`` are names that had no plan.
+        '''
+        for (name, key, optional, _) in self.fields:
+            if name not in result:
+                if from_list:
+                    raise IndexError('Missing value for {0}'.format(key))
+                elif not optional:
+                    raise TypeError('Missing value for {0}'.format(key))
+        if extras:
+            raise TypeError('Additional field(s): {0}'.format(', '.join(extras)))
+        if self.int_keys: # tuple if numbered keys
+            return tuple(self.to_list(result))
+        else:
+            return result
+        
+    def __call__(self, value):
         try:
-            init = cls._abc_class.__init__
+            names = value.keys()
+        except AttributeError:
+            names = range(len(value))
+        names = set(names)
+        result = {}
+        for (name, key, optional, plan) in self.fields:
+            try:
+                item = value[name]
+            except KeyError:
+                if not optional:
+                    raise TypeError('Missing value for {0}'.format(key))
+            else:
+                result[name] = plan(item)
+            names.discard(name)
+        if names:
+            if self.default:
+                for name in names:
+                    result[name] = self.default(value[name])
+            else:
+                raise TypeError('Additional field(s): {0}'.format(', '.join(names)))
+        if self.int_keys: # tuple if numbered keys
+            return tuple(self.to_list(result))
+        else:
+            return result
+        
+        
+class SeqNode:
+    '''
+    Decode the contents of a sequence (as `Collection.seq()`).
+    '''
+    
+    def __init__(self, spec):
+        self.spec = spec
+        try:
+            self.item = _item_plan(spec._abc_type_arguments[0][1])
+        except AttributeError:
+            self.item = IDENTITY
+            
+    def __call__(self, value):
+        if self.item is IDENTITY:
+            return list(value)
+        else:
+            return list(map(self.item, value))
+        
+        
+class SumNode:
+    '''
+    Try each alternative in turn, returning the first that succeeds (as
+    ``Sum._backtrack()``).
+    '''
+    
+    def __init__(self, spec):
+        self.spec = spec
+        self.alternatives = [_item_plan(alternative)
+                             for (_, alternative) in spec._abc_type_arguments]
+        
+    def __call__(self, value):
+        for alternative in self.alternatives:
+            try:
+                return alternative(value)
+            except Exception as e:
+                if isinstance(e, NoBacktrack): raise
+        if issubclass(self.spec, Alt):
+            raise TypeError('No alternative for {0}'.format(value))
+        else:
+            raise TypeError('No alternative for {}'.format(self.spec))
+
+
+class DelayedNode:
+    '''
+    Compile the plan for a ``Delayed()`` spec when first used.
+    '''
+    
+    def __init__(self, spec):
+        self.spec = spec
+        self._plan = None
+        
+    @property
+    def plan(self):
+        if self._plan is None:
+            self._plan = _backtrack_plan(self.spec.get())
+        return self._plan
+        
+    def __call__(self, value):
+        return self.plan(value)
+    
+    
+class Interpret:
+    '''
+    Interpret specs that have no specialised plan (as `Item.default()`).
+    '''
+    
+    def __init__(self, spec):
+        self.spec = spec
+        self._item = interpreter()
+        
+    def __call__(self, value):
+        return self._item.default(value, self.spec)
+
+
+def portable_spec(spec):
+    '''
+    A picklable description of a spec, which `restore_spec()` rebuilds (specs
+    are generated classes, so cannot be pickled directly).  Classes in the 
+    spec are pickled by name, so must be importable.  ``Delayed()`` specs 
+    are not supported.
+    
+      >>> restore_spec(portable_spec(Rec(a=[int], __b=Opt(str)))) is Rec(a=[int], __b=Opt(str))
+      True
+    '''
+    spec = normalize(spec)
+    if issubclass(spec, Delayed):
+        raise DecodeError('Cannot describe Delayed() spec {}'.format(spec))
+    elif issubclass(spec, Cls) and '_abc_class' in vars(spec):
+        return ('Cls', spec._abc_class)
+    elif '_abc_type_arguments' in vars(spec):
+        return (spec._abc_name, tuple((name, portable_spec(arg)) 
+                                      for (name, arg) in spec._abc_type_arguments))
+    else:
+        return spec
+    
+    
+def restore_spec(description):
+    '''
+    Rebuild a spec from the result of `portable_spec()`.
+    '''
+    if not isinstance(description, tuple):
+        return description
+    (name, args) = description
+    if name == 'Cls':
+        return Cls(args)
+    args = [(key, restore_spec(arg)) for (key, arg) in args]
+    if name == 'Opt':
+        return Opt(dict(args)['value'])
+    factory = _FACTORIES[name]
+    if name in ('Rec', 'Atr'):
+        return factory(_dict=dict(args))
+    elif name == 'Alt' and not isinstance(args[0][0], int):
+        return factory(**dict(args))
+    else:
+        return factory(*[arg for (_, arg) in args])
+
+_FACTORIES = {'Seq': Seq, 'Rec': Rec, 'Alt': Alt, 'Atr': Atr, 'And': And, 'Or': Or}
+
+
+@contextmanager
+def mapped(source):
+    '''
+    Provide the contents of ``source`` (a path, ``bytes``, ``bytearray`` or
+    ``memoryview``) as a ``memoryview``, without copying (a file is memory
+    mapped).
+    '''
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        yield memoryview(source)
+        return
+    with open(source, 'rb') as file:
+        try:
+            data = mmap(file.fileno(), 0, access=ACCESS_READ)
+        except ValueError: # an empty file cannot be mapped
+            data = b''
+    view = memoryview(data)
+    try:
+        yield view
+    finally:
+        view.release()
+        if data:
+            try:
+                data.close()
+            except BufferError:
+                pass # slices still exist (eg in a traceback); closed on collection
+            
+
+class BufferReader:
+    '''
+    A ``.read()``-supporting file-like object for a ``memoryview`` (so that 
+    the contents can be read in chunks, as ``bytes``).
+    '''
+    
+    def __init__(self, view):
+        self._view = view
+        self._pos = 0
+        
+    def read(self, size=-1):
+        start = self._pos
+        self._pos = len(self._view) if size < 0 else min(start + size, len(self._view))
+        return self._view[start:self._pos].tobytes()
+    
+    
+class ClassPlan:
+    '''
+    The information, derived from the constructor, needed to encode and 
+    decode instances of a class.  Use `class_plan()` to get a cached 
+    instance.
+    
+    ``kind`` is how `Encoder()` treats instances: ``'atomic'``, ``'map'``,
+    ``'list'`` or ``'object'`` (and, for objects, ``values()`` returns the
+    constructor arguments as a tuple).
+    '''
+    
+    def __init__(self, cls):
+        self.cls = cls
+        self.init = cls.__init__
+        try:
+            init = self.init
             while hasattr(init, '__wrapped__'): init = init.__wrapped__
-            argspec = getfullargspec(init)
+            self.argspec = getfullargspec(init)
+            self.args = tuple(self.argspec.args[1:]) # skip self
         except TypeError:
-            raise DecodeError('{} is not a user-defined class'.format(cls._abc_class))
+            self.argspec = None
+            self.args = ()
+        # converted specs, by converter class (see ClsConverter)
+        self.specs = {}
+        if issubclass(cls, (Atomic, type(None))):
+            self.kind = 'atomic'
+        elif issubclass(cls, Mapping):
+            self.kind = 'map'
+        elif issubclass(cls, Sequence):
+            self.kind = 'list'
+        else:
+            self.kind = 'object'
+        self.values = self.__values()
+            
+    def __values(self):
+        '''
+        Read attributes through ``__dict__`` when the class has no attribute
+        of the same name that could intercept access, and through 
+        ``attrgetter()`` otherwise (including ``__slots__``).
+        '''
+        names = self.args
+        if not names:
+            return lambda value: ()
+        elif len(names) == 1:
+            (name,) = names
+            get_attrs = lambda value: (getattr(value, name),)
+            get_items = lambda values: (values[name],)
+        else:
+            get_attrs, get_items = attrgetter(*names), itemgetter(*names)
+        mro = self.cls.__mro__
+        if self.cls.__getattribute__ is not object.__getattribute__ or \
+                not any('__dict__' in vars(cls) for cls in mro) or \
+                any(name in vars(cls) for cls in mro for name in names):
+            return get_attrs
+        def values(value):
+            try:
+                return get_items(value.__dict__)
+            except KeyError:
+                return get_attrs(value)
+        return values
+        
+
+_class_plans = WeakKeyDictionary()
+
+def class_plan(cls):
+    '''
+    The `ClassPlan()` for the given class, which is cached until the class's
+    ``__init__`` changes.
+    '''
+    try:
+        plan = _class_plans[cls]
+        if plan.init is cls.__init__:
+            return plan
+    except KeyError:
+        pass
+    plan = _class_plans[cls] = ClassPlan(cls)
+    return plan
+
+
+class ClsConverter:
+    
+    def __call__(self, cls):
+        plan = class_plan(cls._abc_class)
+        try:
+            return plan.specs[type(self)]
+        except KeyError:
+            if plan.argspec is None:
+                raise DecodeError('{} is not a user-defined class'.format(cls._abc_class))
+            spec = plan.specs[type(self)] = self.convert(plan.argspec)
+            return spec
+    
+    def convert(self, argspec):
         self._newspec = {}
         names = set()
         if argspec.args: self.args(argspec, names)
@@ -209,10 +664,10 @@ class SeqConverter(ClsConverter):
     the given class constructor.
     '''
     
-    def __call__(self, cls):
+    def convert(self, argspec):
         self._count = 0
         self._index = {}
-        return super().__call__(cls)
+        return super().convert(argspec)
     
     def varkw(self, argspec, names):
         raise DecodeError('**kargs unsupported for list')
@@ -242,6 +697,25 @@ cls_to_seq = SeqConverter()
 class EncodeError(TypeError): pass
 
 
+def _type_error(name, value, eq, type_):
+    return TypeError('{0} for {1} is {2}of type {3}'.format(
+            name, type(value), '' if eq else 'not ', type_))
+
+def _check_attribute(value, name, eq, type_):
+    val = getattr(value, name)
+    if isinstance(val, type_) != eq:
+        raise _type_error(name, val, eq, type_)
+    return val
+
+
+def _unsupported(value):
+    try:
+        name = value.__class__.__name__
+    except:
+        name = type(value)
+    return EncodeError('Cannot encode {} - has both *args and **kargs'.format(name))
+
+
 class Encoder:
     '''
     An instance of this class can be called to encode data::
@@ -257,6 +731,9 @@ class Encoder:
       >>> pprint(encode([1,myInstance,{'a':2}]))
       [1, {'arg1': 42, 'arg2': 'foo'}, {'a': 2}]
       
+    Values are handled according to the `ClassPlan()` for their type (so 
+    each class is examined once).
+      
     :param recurse: Should included values also be encoded?  This depends on the
                     requirements of the calling code (JSON and YAML differ).
                     
@@ -265,112 +742,352 @@ class Encoder:
                    
     :param check_circular: If true, detect and abort on encoding circular data
                            structures.
+                           
+    :param circular_depth: The number of levels of nesting encoded before
+                           checking for circular data (which is then
+                           detected a little later).  Atomic values are 
+                           never checked.
     '''
     
-    def __init__(self, recurse=True, strict=True, check_circular=True):
+    def __init__(self, recurse=True, strict=True, check_circular=True, 
+                 circular_depth=0):
         self._recurse = recurse
         self._strict = strict
         self._check_circular = check_circular
+        self._circular_depth = circular_depth
+        self._depth = 0
         self._check = set()
         
     def recurse(self, value):
         if not self._recurse:
             return value
-        elif id(value) in self._check:
+        plan = class_plan(type(value))
+        # atomic values cannot contain themselves
+        if plan.kind == 'atomic' or not self._check_circular:
+            return self._encode(value, plan)
+        key = self._enter(value)
+        try:
+            return self._encode(value, plan)
+        finally:
+            self._exit(key)
+            
+    def _enter(self, value):
+        '''
+        Track a nested value (unless within ``circular_depth``), returning the
+        key for `_exit()`.
+        '''
+        self._depth += 1
+        if self._depth <= self._circular_depth:
+            return None
+        key = id(value)
+        if key in self._check:
+            self._depth -= 1
             raise EncodeError('Circular data: {}'.format(value))
-        else:
-            if self._check_circular:
-                self._check.add(id(value))
-            try:
-                return self(value)
-            finally:
-                if self._check_circular:
-                    self._check.remove(id(value))
+        self._check.add(key)
+        return key
+    
+    def _exit(self, key):
+        self._depth -= 1
+        if key is not None:
+            self._check.remove(key)
         
-    @overload    
     def __call__(self, value):
-        return value
+        return self._encode(value, class_plan(type(value)))
     
-    @__call__.intercept
-    def object(self, value):
-        try:
-            init = value.__class__.__init__
-            while hasattr(init, '__wrapped__'): init = init.__wrapped__
-            argspec = getfullargspec(init)
-        except TypeError:
-            return self.object.previous(value)
+    def _encode(self, value, plan):
+        kind = plan.kind
+        if kind == 'atomic':
+            return value
+        elif kind == 'map':
+            return self.map(value)
+        elif kind == 'list':
+            return self.list(value)
+        else:
+            return self.object(value, plan)
+    
+    def object(self, value, plan=None):
+        if plan is None: plan = class_plan(type(value))
+        argspec = plan.argspec
+        if argspec is None:
+            return value
         if argspec.varargs and (argspec.varkw or argspec.kwonlyargs):
-            try:
-                name = value.__class__.__name__
-            except:
-                name = type(value)
-            raise EncodeError('Cannot encode {} - has both *args and **kargs'.format(name))
+            raise _unsupported(value)
         elif argspec.varargs:
-            return self.seq(value, argspec)
+            return self.seq(value, plan)
         else:
-            return self.rec(value, argspec)
+            return self.rec(value, plan)
     
-    @__call__.intercept
-    def list(self, value:Sequence):
+    def list(self, value):
         return list(map(self.recurse, value))
     
-    @__call__.intercept
-    def map(self, value:Mapping):
+    def map(self, value):
         return dict((name, self.recurse(value)) for (name, value) in value.items())
     
-    @__call__.intercept
-    def atomic(self, value:Cls(Atomic)):
+    def atomic(self, value):
         return value
     
-    def rec(self, value, argspec):
+    def rec(self, value, plan):
+        argspec, recurse = plan.argspec, self.recurse
+        result = {}
+        for (name, val) in zip(plan.args, plan.values(value)):
+            # reject Callable to catch the common case of methods
+            if callable(val): raise _type_error(name, val, False, Callable)
+            result[name] = recurse(val)
+        try:
+            if argspec.varkw:
+                result.update(recurse(_check_attribute(value, argspec.varkw, True, dict)))
+        except AttributeError:
+            if self._strict: raise
+        try:
+            for name in argspec.kwonlyargs:
+                result[name] = recurse(_check_attribute(value, name, False, Callable))
+        except AttributeError:
+            if self._strict: raise
+        return result
+    
+    def seq(self, value, plan):
+        recurse = self.recurse
+        result = []
+        for (name, val) in zip(plan.args, plan.values(value)):
+            if callable(val): raise _type_error(name, val, False, Callable)
+            result.append(recurse(val))
+        try:
+            result.extend(recurse(_check_attribute(value, plan.argspec.varargs, True, Sequence)))
+        except AttributeError:
+            if self._strict: raise
+        return result
+    
+    def events(self, value):
+        '''
+        Generate the encoding of ``value`` as a series of ``(kind, value)``
+        pairs, following the same rules as a call, but without constructing 
+        the encoded data.  ``kind`` is ``'atomic'``; ``'map'`` or ``'list'``
+        (with value ``None``), followed by the contents and then 
+        ``('end', None)``; or ``'key'`` (before each value in a map).
         
-        def check(name, eq, type_):
-            val = getattr(value, name)
-            if isinstance(val, type_) != eq:
-                raise TypeError('{0} for {1} is {2}of type {3}'.format(
-                        name, type(val), '' if eq else 'not ', type_))
-            return (name, self.recurse(val))
-    
-        def unpack():
-            for name in argspec.args[1:]: # skip self
-                # reject Callable to catch the common case of methods
-                yield check(name, False, Callable)
-            try:
-                if argspec.varkw:
-                    (_, kargs) = check(argspec.varkw, True, dict)
-                    for item in kargs.items(): yield item
-            except AttributeError:
-                if self._strict: raise
-            try:
-                for name in argspec.kwonlyargs:
-                    yield check(name, False, Callable)
-            except AttributeError:
-                if self._strict: raise
-                
-        return dict(unpack())
+          >>> for event in Encoder().events({'a': [1]}): print(event)
+          ('map', None)
+          ('key', 'a')
+          ('list', None)
+          ('atomic', 1)
+          ('end', None)
+          ('end', None)
+        '''
+        return self._events(value, class_plan(type(value)))
     
-    def seq(self, value, argspec):
+    def _events(self, value, plan):
+        kind = plan.kind
+        if kind == 'map':
+            contents = value.items()
+        elif kind == 'list':
+            contents = value
+        elif kind == 'object':
+            (kind, contents) = self._contents(value, plan)
+        if kind == 'atomic':
+            yield ('atomic', value)
+            return
+        yield (kind, None)
+        if kind == 'map':
+            for (name, val) in contents:
+                yield ('key', name)
+                yield from self._child_events(val)
+        else:
+            for val in contents:
+                yield from self._child_events(val)
+        yield ('end', None)
         
-        def check(name, eq, type_):
-            val = getattr(value, name)
-            if isinstance(val, type_) != eq:
-                raise TypeError('{0} for {1} is {2}of type {3}'.format(
-                        name, type(val), '' if eq else 'not ', type_))
-            return self.recurse(val)
-    
-        def unpack():
-            for name in argspec.args[1:]: # skip self
-                # reject Callable to catch the common case of methods
-                yield check(name, False, Callable)
+    def _child_events(self, value):
+        plan = class_plan(type(value))
+        if plan.kind == 'atomic':
+            return (('atomic', value),)
+        elif self._check_circular:
+            return self._tracked_events(value, plan)
+        else:
+            return self._events(value, plan)
+        
+    def _tracked_events(self, value, plan):
+        key = self._enter(value)
+        try:
+            yield from self._events(value, plan)
+        finally:
+            self._exit(key)
+            
+    def _contents(self, value, plan):
+        '''
+        The kind of an object and a generator for the (unencoded) contents, 
+        as `rec()` and `seq()`.
+        '''
+        argspec = plan.argspec
+        if argspec is None:
+            return ('atomic', value)
+        elif argspec.varargs and (argspec.varkw or argspec.kwonlyargs):
+            raise _unsupported(value)
+        elif argspec.varargs:
+            return ('list', self._seq_contents(value, plan))
+        else:
+            return ('map', self._rec_contents(value, plan))
+        
+    def _rec_contents(self, value, plan):
+        argspec = plan.argspec
+        for (name, val) in zip(plan.args, plan.values(value)):
+            if callable(val): raise _type_error(name, val, False, Callable)
+            yield (name, val)
+        try:
+            kargs = _check_attribute(value, argspec.varkw, True, dict) \
+                if argspec.varkw else {}
+        except AttributeError:
+            if self._strict: raise
+            kargs = {}
+        yield from kargs.items()
+        for name in argspec.kwonlyargs:
             try:
-                if argspec.varargs:
-                    args = check(argspec.varargs, True, Sequence)
-                    for item in args: yield item
+                val = _check_attribute(value, name, False, Callable)
             except AttributeError:
                 if self._strict: raise
-                
-        return list(unpack())
+                return
+            yield (name, val)
+            
+    def _seq_contents(self, value, plan):
+        for (name, val) in zip(plan.args, plan.values(value)):
+            if callable(val): raise _type_error(name, val, False, Callable)
+            yield val
+        try:
+            args = _check_attribute(value, plan.argspec.varargs, True, Sequence)
+        except AttributeError:
+            if self._strict: raise
+            args = ()
+        yield from args
     
 
 encode = Encoder()
 
+
+
+def make_encoder(spec):
+    '''
+    Compile the type specification to a function that encodes values in the
+    same way as `encode()`, but with the attributes of each class, and the
+    specs that describe them, found once, in advance.  Values that do not 
+    have the expected type are passed to `encode()`.
+    
+    Circular data that match the spec are not detected (they exceed the 
+    recursion limit).
+
+      >>> class Example():
+      ...     def __init__(self, foo:int, bar:[str]):
+      ...         self.foo = foo
+      ...         self.bar = bar
+      >>> encoder = make_encoder([Example])
+      >>> pprint(encoder([Example(1, ['a']), Example(2, [])]))
+      [{'bar': ['a'], 'foo': 1}, {'bar': [], 'foo': 2}]
+    '''
+    return _encoder_plan(normalize(spec))
+
+
+_encoder_plans = WeakKeyDictionary()
+
+def _encoder_plan(spec):
+    try:
+        return _encoder_plans[spec]
+    except KeyError:
+        plan = _encoder_plans[spec] = _compile_encoder(spec)
+        return plan
+
+def _compile_encoder(spec):
+    if issubclass(spec, Delayed):
+        return lambda value: _encoder_plan(spec.get())(value)
+    elif isinstance(spec, Sub(Cls)):
+        cls = spec._abc_class
+        if cls in (object, dict, list):
+            return encode
+        elif issubclass(cls, Atomic):
+            return lambda value: value if type(value) is cls else encode(value)
+        else:
+            return _class_encoder(spec)
+    elif hasattr(spec, '_abc_type_arguments'):
+        if issubclass(spec, Opt):
+            item = _encoder_plan(dict(spec._abc_type_arguments)['value'])
+            return lambda value: None if value is None else item(value)
+        elif isinstance(spec, Sub(Rec)):
+            return _rec_encoder(spec)
+        elif isinstance(spec, Sub(Seq)):
+            return _seq_encoder(spec)
+    return encode
+
+def _seq_encoder(spec):
+    item = _encoder_plan(spec._abc_type_arguments[0][1])
+    def encode_seq(value):
+        if isinstance(value, (list, tuple)):
+            return [item(v) for v in value]
+        else:
+            return encode(value)
+    return encode_seq
+
+def _field_encoders(spec):
+    fields = dict((Rec.OptKey.unpack(key), _encoder_plan(value))
+                  for (key, value) in spec._abc_type_arguments)
+    return fields, fields.pop('', encode)
+    
+def _rec_encoder(spec):
+    (fields, default) = _field_encoders(spec)
+    def encode_rec(value):
+        if isinstance(value, dict):
+            return dict((name, fields.get(name, default)(v)) 
+                        for (name, v) in value.items())
+        elif isinstance(value, (list, tuple)):
+            return [fields.get(index, default)(v) for (index, v) in enumerate(value)]
+        else:
+            return encode(value)
+    return encode_rec
+
+def _class_encoder(spec):
+    '''
+    Instances of the class are encoded by a function compiled on first use
+    (so that classes can refer to each other) and again if the constructor
+    changes.
+    '''
+    cls = spec._abc_class
+    compiled = [None, None]
+    def encode_object(value):
+        if type(value) is not cls:
+            return encode(value)
+        plan = class_plan(cls)
+        if compiled[0] is not plan:
+            compiled[:] = [plan, _compile_class(spec, plan)]
+        return compiled[1](value)
+    return encode_object
+
+def _compile_class(spec, plan):
+    argspec = plan.argspec
+    if argspec is None or (argspec.varargs and (argspec.varkw or argspec.kwonlyargs)):
+        return encode
+    elif argspec.varargs:
+        (fields, default) = _field_encoders(cls_to_seq(spec))
+        args = tuple((name, fields.get(index, default)) 
+                     for (index, name) in enumerate(plan.args))
+        def encode_seq(value):
+            result = []
+            for ((name, item), val) in zip(args, plan.values(value)):
+                # reject Callable to catch the common case of methods
+                if callable(val): raise _type_error(name, val, False, Callable)
+                result.append(item(val))
+            for val in _check_attribute(value, argspec.varargs, True, Sequence):
+                result.append(default(val))
+            return result
+        return encode_seq
+    else:
+        (fields, default) = _field_encoders(cls_to_rec(spec))
+        args = tuple((name, fields.get(name, default)) for name in plan.args)
+        kwonly = tuple((name, fields.get(name, default)) for name in argspec.kwonlyargs)
+        def encode_rec(value):
+            result = {}
+            for ((name, item), val) in zip(args, plan.values(value)):
+                if callable(val): raise _type_error(name, val, False, Callable)
+                result[name] = item(val)
+            if argspec.varkw:
+                for (name, val) in _check_attribute(value, argspec.varkw, True, dict).items():
+                    result[name] = fields.get(name, default)(val)
+            for (name, item) in kwonly:
+                result[name] = item(_check_attribute(value, name, False, Callable))
+            return result
+        return encode_rec
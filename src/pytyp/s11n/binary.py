@@ -0,0 +1,610 @@
+# The contents of this file are subject to the Mozilla Public License
+# (MPL) Version 1.1 (the "License"); you may not use this file except
+# in compliance with the License. You may obtain a copy of the License
+# at http://www.mozilla.org/MPL/
+#
+# Software distributed under the License is distributed on an "AS IS"
+# basis, WITHOUT WARRANTY OF ANY KIND, either express or implied. See
+# the License for the specific language governing rights and
+# limitations under the License.
+#
+# The Original Code is Pytyp (http://www.acooke.org/pytyp)
+# The Initial Developer of the Original Code is Andrew Cooke.
+# Portions created by the Initial Developer are Copyright (C) 2011
+# Andrew Cooke. All Rights Reserved.
+#
+# Alternatively, the contents of this file may be used under the terms
+# of the LGPL license (the GNU Lesser General Public License,
+# http://www.gnu.org/licenses/lgpl.html), in which case the provisions
+# of the LGPL License are applicable instead of those above.
+#
+# If you wish to allow use of your version of this file only under the
+# terms of the LGPL License and not to allow others to use your version
+# of this file under the MPL, indicate your decision by deleting the
+# provisions above and replace them with the notice and other provisions
+# required by the LGPL License.  If you do not delete the provisions
+# above, a recipient may use your version of this file under either the
+# MPL or the LGPL License.
+
+from collections import Mapping
+from pickle import dumps as pickle_dumps, loads as pickle_loads, PicklingError, \
+    UnpicklingError
+from struct import Struct, error as StructError
+from weakref import WeakKeyDictionary
+
+from pytyp.s11n.base import EncodeError, DecodeError, Encoder, encode, \
+    class_plan, cls_to_rec, cls_to_seq, mapped
+from pytyp.spec.abcs import Seq, Sub, Rec, Cls, Alt, Atomic, Delayed, normalize
+from pytyp.spec.check import accepted_classes
+
+
+def write_varint(buffer, value):
+    '''
+    Append an unsigned integer to ``buffer`` (a ``bytearray``), using 7 bits
+    per byte.
+    '''
+    while value > 0x7f:
+        buffer.append((value & 0x7f) | 0x80)
+        value >>= 7
+    buffer.append(value)
+
+
+def read_varint(data, offset):
+    '''
+    Read an unsigned integer written by ``write_varint()``, returning the
+    value and the new offset.
+    '''
+    (result, shift) = (0, 0)
+    while True:
+        byte = data[offset]
+        offset += 1
+        result |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return (result, offset)
+        shift += 7
+        
+
+def write_bytes(buffer, value):
+    write_varint(buffer, len(value))
+    buffer += value
+    
+    
+def read_bytes(data, offset):
+    (length, offset) = read_varint(data, offset)
+    end = offset + length
+    if end > len(data):
+        raise DecodeError('Truncated data at {}'.format(offset))
+    return (data[offset:end], end)
+
+
+FIXED = {int: 'q', float: 'd', bool: '?'}
+
+
+class RecordCodec:
+    '''
+    Encode and decode instances of a class created by ``record()``.
+    
+    Fields whose spec is ``int``, ``float`` or ``bool`` are packed with
+    ``struct`` in declared order.  Other fields follow, in declared order,
+    each prefixed by its length: ``str`` and ``bytes`` directly, nested
+    records with their own codec and anything else pickled.  Field names
+    are not included, except for additional (``__``) fields, which are
+    pickled together at the end.
+    '''
+    
+    def __init__(self, record_class):
+        self._record = record_class
+        self._names = set(record_class._fields)
+        fixed, self._variable = [], []
+        for name in record_class._fields:
+            classes = accepted_classes(record_class._spec(name))
+            if classes and len(classes) == 1 and classes[0] in FIXED:
+                fixed.append((name, classes[0]))
+            else:
+                self._variable.append(
+                    (name,) + self._field_codec(classes[0] if classes and 
+                                                len(classes) == 1 else None))
+        self._fixed_names = tuple(name for (name, _) in fixed)
+        self._fixed_types = tuple(type_ for (_, type_) in fixed)
+        self._struct = Struct('<' + ''.join(FIXED[type_] for (_, type_) in fixed))
+        
+    @staticmethod
+    def _field_codec(class_):
+        def exact(encode):
+            def encoder(value):
+                if type(value) is not class_:
+                    raise EncodeError('{!r} is not {}'.format(value, class_))
+                return encode(value)
+            return encoder
+        if class_ is str:
+            return (exact(lambda value: value.encode('utf8')), 
+                    lambda data: str(data, 'utf8'))
+        elif class_ is bytes:
+            return (exact(lambda value: value), bytes)
+        elif hasattr(class_, '_fields') and hasattr(class_, '_build'):
+            codec = record_codec(class_)
+            return (exact(codec.encode), codec.decode)
+        else:
+            return (pickle_dumps, pickle_loads)
+            
+    def encode(self, record):
+        '''
+        Encode ``record`` as ``bytes``.  An ``EncodeError`` is raised if the
+        contents do not match the specs.
+        '''
+        buffer = bytearray()
+        values = [record[name] for name in self._fixed_names]
+        for (value, type_) in zip(values, self._fixed_types):
+            if type(value) is not type_:
+                raise EncodeError('{!r} is not {}'.format(value, type_))
+        try:
+            buffer += self._struct.pack(*values)
+        except StructError as e:
+            raise EncodeError(str(e))
+        for (name, encode, _) in self._variable:
+            write_bytes(buffer, encode(record[name]))
+        extras = dict((name, value) for (name, value) in record.items()
+                      if name not in self._names)
+        write_bytes(buffer, pickle_dumps(extras) if extras else b'')
+        return bytes(buffer)
+    
+    def decode(self, data):
+        '''
+        Create a record from data written by ``encode()``.
+        '''
+        data = memoryview(data)
+        values = dict(zip(self._fixed_names, self._struct.unpack_from(data)))
+        offset = self._struct.size
+        for (name, _, decode) in self._variable:
+            (value, offset) = read_bytes(data, offset)
+            values[name] = decode(value)
+        contents = dict((name, values[name]) for name in self._record._fields)
+        (extras, offset) = read_bytes(data, offset)
+        if extras:
+            contents.update(pickle_loads(extras))
+        return self._record._build(contents)
+    
+
+_codecs = WeakKeyDictionary()
+
+def record_codec(record_class):
+    '''
+    The (cached) ``RecordCodec`` for the given record class.
+    '''
+    try:
+        return _codecs[record_class]
+    except KeyError:
+        codec = _codecs[record_class] = RecordCodec(record_class)
+        return codec
+
+
+def reduce_record(record):
+    '''
+    Reduce a record for ``pickle`` (this is the ``__reduce_ex__()`` method
+    of all record classes; ``copy`` uses ``__copy__()`` and 
+    ``__deepcopy__()``).  Records that cannot be encoded (eg. contents that
+    do not match their specs, or values that cannot be pickled) are reduced
+    to a dict instead.
+    '''
+    record_class = type(record)
+    try:
+        return (load_record, (record_class, record_codec(record_class).encode(record)))
+    except (EncodeError, StructError, TypeError, PicklingError):
+        return (record_class._build, (dict(record),))
+    
+
+def load_record(record_class, data):
+    '''
+    Create a record from data written by ``reduce_record()``.
+    '''
+    return record_codec(record_class).decode(data)
+
+
+def make_dumps(spec):
+    '''
+    Create a function that encodes values of the given type as compact 
+    ``bytes``.  The structure is described by the spec, so neither field
+    names nor types are written: integers are zigzag varints, floats are 
+    8 bytes, strings and bytes are prefixed by their length, ``Alt()`` 
+    (and ``Opt()``) values by the index of the alternative, sequences by 
+    their length and records by a bit mask for any optional fields (and a
+    count of any additional fields, which are named).  Classes are encoded 
+    as records (or, with ``*args``, tuples) and values without a specific 
+    type (eg. ``ANY``) are tagged.
+
+    :param spec: The type specification for the values.
+    :return: A function that takes a value and returns ``bytes``.  An
+             ``EncodeError`` is raised if the value does not match the spec.
+    
+      >>> from pytyp.spec.abcs import Opt
+      >>> class Example():
+      ...     def __init__(self, foo:int, bar:Opt(str)):
+      ...         self.foo = foo
+      ...         self.bar = bar
+      ...     def __repr__(self):
+      ...         return '<Example({0},{1})>'.format(self.foo, self.bar)
+      >>> dumps, loads = make_dumps([Example]), make_loads([Example])
+      >>> data = dumps([Example(1, 'a'), Example(-2, None)])
+      >>> data
+      b'\\x02\\x01\\x01a\\x02\\x00\\x03'
+      >>> loads(data)
+      [<Example(1,a)>, <Example(-2,None)>]
+    '''
+    (encode, _) = _codec(normalize(spec))
+    def dumps(value):
+        buffer = bytearray()
+        encode(buffer, value)
+        return bytes(buffer)
+    return dumps
+
+
+def make_loads(spec):
+    '''
+    Create a function that decodes values written by the function from
+    `make_dumps()` for the same spec.  The data are read through a 
+    ``memoryview``, so are not copied (except to construct strings, etc).
+
+    :param spec: The type specification for the values.
+    :return: A function that takes ``bytes`` (or a ``bytearray``, 
+             ``memoryview`` or the path to a file, which is memory mapped)
+             and returns a value structured as ``spec``.  A ``DecodeError``
+             is raised if the data are truncated or invalid.
+    '''
+    (_, decode) = _codec(normalize(spec))
+    def loads(data):
+        with mapped(data) as data:
+            try:
+                (value, offset) = decode(data, 0)
+            except DecodeError:
+                raise
+            except (IndexError, TypeError, StructError, UnicodeDecodeError,
+                    UnpicklingError) as e:
+                raise DecodeError('Invalid data: {}'.format(e)) from e
+            if offset != len(data):
+                raise DecodeError('Extra data at {}'.format(offset))
+            return value
+    return loads
+
+
+# codecs are (encode, decode) pairs; encode(buffer, value) appends to a 
+# bytearray and decode(data, offset) returns (value, offset).
+
+_spec_codecs = WeakKeyDictionary()
+
+def _codec(spec):
+    try:
+        return _spec_codecs[spec]
+    except KeyError:
+        codec = _spec_codecs[spec] = _compile(spec)
+        return codec
+
+def _compile(spec):
+    if issubclass(spec, Delayed):
+        return (lambda buffer, value: _codec(spec.get())[0](buffer, value),
+                lambda data, offset: _codec(spec.get())[1](data, offset))
+    elif isinstance(spec, Sub(Cls)):
+        cls = spec._abc_class
+        if cls in _ATOMIC:
+            return _ATOMIC[cls]
+        elif cls in (object, dict, list, tuple) or issubclass(cls, Atomic):
+            return (_encode_any, _decode_any)
+        else:
+            return _class_codec(spec)
+    elif hasattr(spec, '_abc_type_arguments'):
+        if issubclass(spec, Alt):
+            return _alt_codec(spec)
+        elif isinstance(spec, Sub(Rec)):
+            return _rec_codec(spec)
+        elif isinstance(spec, Sub(Seq)):
+            return _seq_codec(spec)
+    return (_encode_any, _decode_any)
+
+
+def _mismatch(value, spec):
+    return EncodeError('{!r} is not {}'.format(value, spec))
+
+def _encode_none(buffer, value):
+    if value is not None: raise _mismatch(value, None)
+
+def _decode_none(data, offset):
+    return (None, offset)
+
+def _encode_bool(buffer, value):
+    if type(value) is not bool: raise _mismatch(value, bool)
+    buffer.append(1 if value else 0)
+
+def _decode_bool(data, offset):
+    return (data[offset] != 0, offset + 1)
+
+def _encode_int(buffer, value):
+    if type(value) is not int: raise _mismatch(value, int)
+    # zigzag, so that small negative values are short
+    write_varint(buffer, value << 1 if value >= 0 else (-value << 1) - 1)
+    
+def _decode_int(data, offset):
+    (value, offset) = read_varint(data, offset)
+    return ((value >> 1) ^ -(value & 1), offset)
+
+_DOUBLE = Struct('<d')
+
+def _encode_float(buffer, value):
+    if type(value) is not float: raise _mismatch(value, float)
+    buffer += _DOUBLE.pack(value)
+    
+def _decode_float(data, offset):
+    return (_DOUBLE.unpack_from(data, offset)[0], offset + 8)
+
+def _encode_str(buffer, value):
+    if type(value) is not str: raise _mismatch(value, str)
+    write_bytes(buffer, value.encode('utf8'))
+    
+def _decode_str(data, offset):
+    (value, offset) = read_bytes(data, offset)
+    return (str(value, 'utf8'), offset)
+
+def _encode_bytes(buffer, value):
+    if type(value) is not bytes: raise _mismatch(value, bytes)
+    write_bytes(buffer, value)
+    
+def _decode_bytes(data, offset):
+    (value, offset) = read_bytes(data, offset)
+    return (bytes(value), offset)
+
+_ATOMIC = {type(None): (_encode_none, _decode_none),
+           bool: (_encode_bool, _decode_bool),
+           int: (_encode_int, _decode_int),
+           float: (_encode_float, _decode_float),
+           str: (_encode_str, _decode_str),
+           bytes: (_encode_bytes, _decode_bytes)}
+
+
+# values without a specific type are preceded by a tag
+(_NONE, _FALSE, _TRUE, _INT, _FLOAT, _STR, _BYTES, _LIST, _MAP) = range(9)
+
+def _encode_any(buffer, value):
+    type_ = type(value)
+    if value is None:
+        buffer.append(_NONE)
+    elif type_ is bool:
+        buffer.append(_TRUE if value else _FALSE)
+    elif type_ is int:
+        buffer.append(_INT)
+        _encode_int(buffer, value)
+    elif type_ is float:
+        buffer.append(_FLOAT)
+        buffer += _DOUBLE.pack(value)
+    elif type_ is str:
+        buffer.append(_STR)
+        write_bytes(buffer, value.encode('utf8'))
+    elif type_ is bytes:
+        buffer.append(_BYTES)
+        write_bytes(buffer, value)
+    elif type_ is list or type_ is tuple:
+        buffer.append(_LIST)
+        write_varint(buffer, len(value))
+        for item in value:
+            _encode_any(buffer, item)
+    elif type_ is dict:
+        buffer.append(_MAP)
+        write_varint(buffer, len(value))
+        for (name, item) in value.items():
+            _encode_any(buffer, name)
+            _encode_any(buffer, item)
+    else:
+        encoded = encode(value)
+        if encoded is value:
+            raise EncodeError('Cannot encode {!r}'.format(value))
+        _encode_any(buffer, encoded)
+
+def _decode_any(data, offset):
+    tag = data[offset]
+    return _DECODE_ANY[tag](data, offset + 1)
+
+def _decode_list(data, offset):
+    (count, offset) = read_varint(data, offset)
+    result = []
+    for _ in range(count):
+        (item, offset) = _decode_any(data, offset)
+        result.append(item)
+    return (result, offset)
+
+def _decode_map(data, offset):
+    (count, offset) = read_varint(data, offset)
+    result = {}
+    for _ in range(count):
+        (name, offset) = _decode_any(data, offset)
+        (result[name], offset) = _decode_any(data, offset)
+    return (result, offset)
+
+_DECODE_ANY = (_decode_none, lambda data, offset: (False, offset), 
+               lambda data, offset: (True, offset), _decode_int, _decode_float,
+               _decode_str, _decode_bytes, _decode_list, _decode_map)
+
+
+def _alt_codec(spec):
+    codecs = [_codec(alternative) for (_, alternative) in spec._abc_type_arguments]
+    def encode_alt(buffer, value):
+        mark = len(buffer)
+        for (index, (encode_, _)) in enumerate(codecs):
+            write_varint(buffer, index)
+            try:
+                return encode_(buffer, value)
+            except EncodeError:
+                del buffer[mark:]
+        raise _mismatch(value, spec)
+    def decode_alt(data, offset):
+        (index, offset) = read_varint(data, offset)
+        return codecs[index][1](data, offset)
+    return (encode_alt, decode_alt)
+
+
+def _seq_codec(spec):
+    (encode_item, decode_item) = _codec(spec._abc_type_arguments[0][1])
+    def encode_seq(buffer, value):
+        if not isinstance(value, (list, tuple)): raise _mismatch(value, spec)
+        write_varint(buffer, len(value))
+        for item in value:
+            encode_item(buffer, item)
+    def decode_seq(data, offset):
+        (count, offset) = read_varint(data, offset)
+        result = []
+        for _ in range(count):
+            (item, offset) = decode_item(data, offset)
+            result.append(item)
+        return (result, offset)
+    return (encode_seq, decode_seq)
+
+
+def _rec_fields(spec):
+    fields, default = [], None
+    for (key, value) in spec._abc_type_arguments:
+        name = Rec.OptKey.unpack(key)
+        if name == '':
+            default = _codec(value)
+        else:
+            fields.append((name, isinstance(key, Rec.OptKey), _codec(value)))
+    return (fields, default)
+
+def _rec_codec(spec):
+    (fields, default) = _rec_fields(spec)
+    if fields and all(isinstance(name, int) for (name, _, _) in fields):
+        return _tuple_codec(spec, fields, default)
+    else:
+        return _map_codec(spec, fields, default)
+    
+def _tuple_codec(spec, fields, default):
+    '''
+    Records with integer indices are written as a count and the values.
+    '''
+    fields = sorted(fields, key=lambda field: field[0])
+    codecs = [codec for (_, _, codec) in fields]
+    required = max([index + 1 for (index, optional, _) in fields if not optional] or [0])
+    def encode_tuple(buffer, value):
+        if not isinstance(value, (list, tuple)) or len(value) < required or \
+                (default is None and len(value) > len(codecs)):
+            raise _mismatch(value, spec)
+        write_varint(buffer, len(value))
+        for (index, item) in enumerate(value):
+            (codecs[index] if index < len(codecs) else default)[0](buffer, item)
+    def decode_tuple(data, offset):
+        (count, offset) = read_varint(data, offset)
+        result = []
+        for index in range(count):
+            (item, offset) = (codecs[index] if index < len(codecs) 
+                              else default)[1](data, offset)
+            result.append(item)
+        return (tuple(result), offset)
+    return (encode_tuple, decode_tuple)
+    
+def _map_codec(spec, fields, default):
+    '''
+    Records with names are written as the required values, a mask and the
+    optional values present, and then (if there is a default spec) a count 
+    and the additional names and values.
+    '''
+    required = [(name, codec) for (name, optional, codec) in fields if not optional]
+    optional = [(name, codec) for (name, optional, codec) in fields if optional]
+    names = set(name for (name, _, _) in fields)
+    def encode_map(buffer, value):
+        if not isinstance(value, Mapping): raise _mismatch(value, spec)
+        for (name, (encode_, _)) in required:
+            try:
+                item = value[name]
+            except KeyError:
+                raise EncodeError('Missing {!r} for {}'.format(name, spec))
+            encode_(buffer, item)
+        count = len(required)
+        if optional:
+            present = [(name, encode_) for (name, (encode_, _)) in optional 
+                       if name in value]
+            write_varint(buffer, sum(1 << index for (index, (name, _)) 
+                                     in enumerate(optional) if name in value))
+            for (name, encode_) in present:
+                encode_(buffer, value[name])
+            count += len(present)
+        if default:
+            extras = [(name, item) for (name, item) in value.items() 
+                      if name not in names]
+            write_varint(buffer, len(extras))
+            for (name, item) in extras:
+                _encode_str(buffer, name)
+                default[0](buffer, item)
+        elif len(value) > count:
+            raise EncodeError('Unexpected names in {!r} for {}'.format(value, spec))
+    def decode_map(data, offset):
+        result = {}
+        for (name, (_, decode_)) in required:
+            (result[name], offset) = decode_(data, offset)
+        if optional:
+            (mask, offset) = read_varint(data, offset)
+            for (index, (name, (_, decode_))) in enumerate(optional):
+                if mask & (1 << index):
+                    (result[name], offset) = decode_(data, offset)
+        if default:
+            (count, offset) = read_varint(data, offset)
+            for _ in range(count):
+                (name, offset) = _decode_str(data, offset)
+                (result[name], offset) = default[1](data, offset)
+        return (result, offset)
+    return (encode_map, decode_map)
+
+
+_shallow = Encoder(recurse=False)
+
+def _class_codec(spec):
+    '''
+    Records (from ``record()``) use their own codec; other classes are
+    encoded (following the `Encoder()` rules) as records (omitting default
+    values) or, with ``*args``, tuples, using a codec that is compiled on 
+    first use (so that classes can refer to each other) and again if the 
+    constructor changes.
+    '''
+    cls = spec._abc_class
+    if hasattr(cls, '_fields') and hasattr(cls, '_build'):
+        codec = record_codec(cls)
+        def encode_record(buffer, value):
+            if type(value) is not cls: raise _mismatch(value, cls)
+            write_bytes(buffer, codec.encode(value))
+        def decode_record(data, offset):
+            (value, offset) = read_bytes(data, offset)
+            return (codec.decode(value), offset)
+        return (encode_record, decode_record)
+    compiled = [None, None]
+    def class_codec():
+        plan = class_plan(cls)
+        if compiled[0] is not plan:
+            compiled[:] = [plan, _compile_class(spec, plan)]
+        return compiled[1]
+    def encode_object(buffer, value):
+        if type(value) is not cls: raise _mismatch(value, cls)
+        class_codec()[0](buffer, _shallow(value))
+    def decode_object(data, offset):
+        return class_codec()[1](data, offset)
+    return (encode_object, decode_object)
+
+def _compile_class(spec, plan):
+    cls = spec._abc_class
+    if plan.argspec is not None and plan.argspec.varargs:
+        # always a tuple, even if there are only *args
+        args = cls_to_seq(spec)
+        (encode_, decode_) = _tuple_codec(args, *_rec_fields(args))
+        def decode_args(data, offset):
+            (args, offset) = decode_(data, offset)
+            return (cls(*args), offset)
+        return (encode_, decode_args)
+    else:
+        (encode_, decode_) = _codec(cls_to_rec(spec))
+        # values that are the constructor's defaults are omitted
+        argspec = plan.argspec
+        defaults = list(zip(plan.args[len(plan.args) - len(argspec.defaults or ()):],
+                            argspec.defaults or ()))
+        defaults.extend((argspec.kwonlydefaults or {}).items())
+        def encode_kargs(buffer, kargs):
+            for (name, default) in defaults:
+                if name in kargs and kargs[name] is default:
+                    del kargs[name]
+            encode_(buffer, kargs)
+        def decode_kargs(data, offset):
+            (kargs, offset) = decode_(data, offset)
+            return (cls(**kargs), offset)
+        return (encode_kargs, decode_kargs)
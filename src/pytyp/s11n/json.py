@@ -26,11 +26,20 @@
 # above, a recipient may use your version of this file under either the
 # MPL or the LGPL License.
 
+from codecs import getincrementaldecoder
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice, chain, repeat
 from json import JSONDecoder as JSONDecoder_, load as load_, loads as loads_, \
-    JSONEncoder as JSONEncoder_, dump as dump_, dumps as dumps_
+    JSONEncoder as JSONEncoder_, dump as dump_, dumps as dumps_, detect_encoding
+from json.decoder import JSONDecodeError, WHITESPACE, WHITESPACE_STR, scanstring
+from collections import Sequence
+from pickle import dumps as pickle, PicklingError
 from pprint import pprint
 
-from pytyp.s11n.base import decode, Encoder
+from pytyp.s11n.base import make_decoder, make_encoder, Encoder, IDENTITY, Construct, \
+    RecNode, SeqNode, DelayedNode, DecodeError, EncodeError, portable_spec, \
+    restore_spec, mapped, BufferReader
+from pytyp.spec.abcs import normalize, Seq
 
 
 def dump(obj, fp, **kargs):
@@ -108,31 +117,482 @@ def dumps(obj, **kargs):
     return dumps_(obj, cls=JSONEncoder, **kargs)
 
 
+def iterencode(obj, **kargs):
+    '''
+    Serialize ``obj`` to JSON, as `dumps()`, but generating the output as a
+    series of strings.  Objects are encoded as they are reached (by 
+    `JSONEncoder`) so no encoded copy of the whole of ``obj`` is constructed.
+
+    :param obj: The Python object (or collection) to encode.
+    :param kargs: Additional parameters are passed directly to the 
+                  corresponding routine in Python's json package.
+    :return: A generator of strings that together contain the JSON encoded
+             ``obj``.
+
+      >>> class Example():
+      ...     def __init__(self, foo):
+      ...         self.foo = foo
+      >>> list(iterencode([Example(1)]))
+      ['[', '{', '"foo"', ': ', '1', '}', ']']
+    '''
+    return JSONEncoder(**kargs).iterencode(obj)
+
+
+def make_dumps(spec):
+    '''
+    Create a replacement for `dumps()` that is specialised to data of the 
+    given type.  Classes in ``spec`` (and the specs of their attributes) are
+    examined once, here, rather than for each value, so encoding is almost
+    as fast as dumping plain dicts and lists.  Values that do not match the 
+    spec are encoded by `dumps()`.
+    
+    :param spec: The type specification for the root object.
+    :return: A replacement for `dumps()`, taking the same parameters.
+    
+      >>> class Example():
+      ...     def __init__(self, foo:int, bar:str):
+      ...         self.foo = foo
+      ...         self.bar = bar
+      >>> dumps = make_dumps([Example])
+      >>> dumps([Example(1, 'a'), Example(2, 'b')], sort_keys=True)
+      '[{"bar": "a", "foo": 1}, {"bar": "b", "foo": 2}]'
+    '''
+    encoder = make_encoder(spec)
+    def dumps(obj, **kargs):
+        return dumps_(encoder(obj), cls=JSONEncoder, **kargs)
+    return dumps
+
+
+def make_dump(spec):
+    '''
+    Create a replacement for `dump()` that is specialised to data of the 
+    given type (see `make_dumps()`).
+    
+    :param spec: The type specification for the root object.
+    :return: A replacement for `dump()`, taking the same parameters.
+    '''
+    encoder = make_encoder(spec)
+    def dump(obj, fp, **kargs):
+        return dump_(encoder(obj), fp, cls=JSONEncoder, **kargs)
+    return dump
+
+
+def dump_lines(iterable, fp, buffer_size=65536, **kargs):
+    '''
+    Serialize each value from ``iterable`` as a line of JSON (JSON Lines, or
+    NDJSON) to ``fp``.  Output is collected and written in blocks of about
+    ``buffer_size`` characters.
+
+    :param iterable: The Python objects to encode.
+    :param fp: The destination for the data.
+    :param buffer_size: The approximate size of each write.
+    :param kargs: Additional parameters are passed directly to the 
+                  corresponding routine in Python's json package (except
+                  ``indent``, which would split values over lines).
+    :return: None (output written to `fp`)
+    
+      >>> from io import StringIO
+      >>> class Example():
+      ...     def __init__(self, foo):
+      ...         self.foo = foo
+      >>> out = StringIO()
+      >>> dump_lines([Example('abc'), {'bar': 1}], out)
+      >>> out.getvalue()
+      '{"foo": "abc"}\\n{"bar": 1}\\n'
+    '''
+    if kargs.get('indent') is not None:
+        raise ValueError('dump_lines does not support indent')
+    encode = JSONEncoder(**kargs).encode
+    buffer, size = [], 0
+    for value in iterable:
+        line = encode(value) + '\n'
+        buffer.append(line)
+        size += len(line)
+        if size >= buffer_size:
+            fp.write(''.join(buffer))
+            buffer, size = [], 0
+    if buffer:
+        fp.write(''.join(buffer))
+
+
+def dumps_parallel(obj, workers=None, chunksize=10000, **kargs):
+    '''
+    Serialize a sequence to a JSON array, as `dumps()`, but encoding chunks
+    of the sequence in separate processes.  The values must be picklable 
+    (so classes must be importable).  If ``obj`` is not a sequence, or is 
+    no longer than ``chunksize``, or ``workers`` is 1, then the work is done
+    here, with no processes.
+
+    :param obj: The sequence to encode.
+    :param workers: The number of processes (by default, the number of 
+                    CPUs).
+    :param chunksize: The number of values sent to a process at once.
+    :param kargs: Additional parameters are passed directly to the 
+                  corresponding routine in Python's json package.
+    :return: A string containing the JSON encoded ``obj``.
+    
+      >>> dumps_parallel(list(range(5)), chunksize=2)
+      '[0, 1, 2, 3, 4]'
+    '''
+    return ''.join(_iter_parallel(obj, workers, chunksize, kargs))
+
+
+def dump_parallel(obj, fp, workers=None, chunksize=10000, **kargs):
+    '''
+    Serialize a sequence as a JSON array to ``fp``, as `dump()`, but 
+    encoding chunks of the sequence in separate processes (see 
+    `dumps_parallel()`).  Chunks are written, in order, as they are 
+    available.
+    '''
+    for text in _iter_parallel(obj, workers, chunksize, kargs):
+        fp.write(text)
+
+
+def _iter_parallel(obj, workers, chunksize, kargs):
+    if not isinstance(obj, Sequence) or isinstance(obj, (str, bytes)) or \
+            len(obj) <= chunksize or workers == 1:
+        yield dumps(obj, **kargs)
+        return
+    try:
+        pickle(obj[0])
+    except (PicklingError, AttributeError, TypeError) as e:
+        raise EncodeError('Values cannot be sent to worker processes ({}); '
+                          'classes must be importable'.format(e))
+    (open_, separator, close, strip) = _array_layout(kargs)
+    chunks = (obj[i:i + chunksize] for i in range(0, len(obj), chunksize))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        texts = executor.map(_dumps_chunk, chunks, repeat(kargs))
+        for (i, text) in enumerate(texts):
+            yield (separator if i else open_) + text[strip:-strip]
+    yield close
+
+
+def _array_layout(kargs):
+    '''
+    Values in an array can be encoded separately as (single-valued) arrays,
+    with ``strip`` characters removed from each end, and then joined with
+    the returned strings.
+    '''
+    indent = kargs.get('indent')
+    if kargs.get('separators'):
+        separator = kargs['separators'][0]
+    else:
+        separator = ', ' if indent is None else ','
+    if indent is None:
+        return ('[', separator, ']', 1)
+    else:
+        return ('[\n', separator + '\n', '\n]', 2)
+
+
+def dump_iter(iterable, fp, spec=None, buffer_size=65536, **kargs):
+    '''
+    Serialize the values from ``iterable`` (eg. a generator) as a JSON array
+    to ``fp``, as `dump()` would serialize a list of the same values, but
+    without constructing the list.  Output is collected and written in 
+    blocks of about ``buffer_size`` characters.
+
+    :param iterable: The Python objects to encode.
+    :param fp: The destination for the data.
+    :param spec: If given, the type specification for the values, used to 
+                 compile an encoder (see `make_dumps()`).  If this is a 
+                 ``Seq()`` then the element spec is used.
+    :param buffer_size: The approximate size of each write.
+    :param kargs: Additional parameters are passed directly to the 
+                  corresponding routine in Python's json package.
+    :return: None (output written to `fp`)
+    
+      >>> from io import StringIO
+      >>> class Example():
+      ...     def __init__(self, foo):
+      ...         self.foo = foo
+      >>> out = StringIO()
+      >>> dump_iter((Example(i) for i in range(3)), out)
+      >>> out.getvalue()
+      '[{"foo": 0}, {"foo": 1}, {"foo": 2}]'
+    '''
+    if spec is not None:
+        spec = normalize(spec)
+        if issubclass(spec, Seq) and hasattr(spec, '_abc_type_arguments'):
+            spec = spec._abc_type_arguments[0][1]
+        encoder = make_encoder(spec)
+    else:
+        encoder = None
+    encode = JSONEncoder(**kargs).encode
+    (open_, separator, close, strip) = _array_layout(kargs)
+    buffer, size, empty = [open_], 0, True
+    for value in iterable:
+        if encoder: value = encoder(value)
+        text = encode([value])[strip:-strip]
+        if empty:
+            empty = False
+        else:
+            buffer.append(separator)
+        buffer.append(text)
+        size += len(text)
+        if size >= buffer_size:
+            fp.write(''.join(buffer))
+            buffer, size = [], 0
+    fp.write('[]' if empty else ''.join(buffer) + close)
+
+
+def _dumps_chunk(chunk, kargs):
+    return dumps(chunk, **kargs)
+
+
 class JSONEncoder(JSONEncoder_):
     
     default = Encoder(recurse=False)
 
 
 
-def make_load(spec):
+def make_load(spec, single_pass=False):
     '''
     Create a replacement for the ``load()`` function in Python's json package
     that will deserialize a ``.read()``-supporting file-like object containing a
     JSON document to a Python object.
 
+    The returned function also accepts a path (which is memory mapped) or 
+    ``bytes``, ``bytearray`` or ``memoryview``, which are decoded to text
+    directly (so the raw data are not copied to ``bytes``, although the text
+    must still be constructed, since Python's json package only parses 
+    ``str``).
+
     :param spec: The type specification for the root object.  Nested objects
                  are defined by type annotations.  See :ref:`decoding` for
                  full details.
+    :param single_pass: If true, decode while parsing (see 
+                        `make_JSONDecoder()`).
     :return: A replacement for ``load()`` in the Python json package, which will
              read from a file are return the data structured as ``spec``.
+             
+      >>> load = make_load([int])
+      >>> load(memoryview(b'[1, 2]'))
+      [1, 2]
     '''
-    cls = make_JSONDecoder(spec)
+    cls = make_JSONDecoder(spec, single_pass=single_pass)
     def load(fp, **kargs):
-        return load_(fp, cls=cls, **kargs)
+        if hasattr(fp, 'read'):
+            return load_(fp, cls=cls, **kargs)
+        with mapped(fp) as data:
+            text = str(data, detect_encoding(data[:4].tobytes()))
+        return loads_(text, cls=cls, **kargs)
     return load
 
 
-def make_loads(spec):
+def make_iterload(spec, chunk_size=65536, single_pass=False):
+    '''
+    Create a function that reads a ``.read()``-supporting file-like object
+    (text or bytes) in chunks, and yields decoded values one at a time.  If
+    the input is a JSON array, each element is a value; otherwise the input
+    is a stream of concatenated values (eg one per line).  Memory used is
+    bounded by the size of a single value (plus a chunk).
+
+    :param spec: The type specification for the values.  If this is a 
+                 ``Seq()`` then the element spec is used (so the same spec 
+                 can be given to `make_load()` and `make_iterload()`).
+    :param chunk_size: The amount of data to read at once (more is read when
+                       a single value spans several chunks).
+    :param single_pass: If true, decode while parsing (see 
+                        `make_JSONDecoder()`).
+    :return: A function that takes a file-like object, path (which is 
+             memory mapped) or ``bytes``, ``bytearray`` or ``memoryview``
+             (and any additional arguments for the ``JSONDecoder`` class) 
+             and returns a generator of values structured as ``spec``.
+
+      >>> from io import StringIO
+      >>> class Example():
+      ...     def __init__(self, foo):
+      ...         self.foo = foo
+      ...     def __repr__(self):
+      ...         return '<Example({0})>'.format(self.foo)
+      >>> iterload = make_iterload([Example])
+      >>> list(iterload(StringIO('[{"foo": "abc"}, {"foo": "xyz"}]')))
+      [<Example(abc)>, <Example(xyz)>]
+      >>> list(iterload(StringIO('{"foo": "abc"}\\n{"foo": "xyz"}\\n')))
+      [<Example(abc)>, <Example(xyz)>]
+    '''
+    spec = normalize(spec)
+    if issubclass(spec, Seq) and hasattr(spec, '_abc_type_arguments'):
+        spec = spec._abc_type_arguments[0][1]
+    cls = make_JSONDecoder(spec, single_pass=single_pass)
+    def iterload(fp, **kargs):
+        if hasattr(fp, 'read'):
+            yield from iterload_file(fp, **kargs)
+        else:
+            with mapped(fp) as data:
+                yield from iterload_file(BufferReader(data), **kargs)
+    def iterload_file(fp, **kargs):
+        decoder = cls(**kargs)
+        text = ChunkedText(fp, chunk_size)
+        if text.skip() == '[':
+            text.pos += 1
+            if text.skip() == ']':
+                text.pos += 1
+            else:
+                while True:
+                    yield text.decode(decoder)
+                    nextchar = text.skip()
+                    text.pos += 1
+                    if nextchar == ']':
+                        break
+                    elif nextchar != ',':
+                        raise text.locate(JSONDecodeError(
+                            "Expecting ',' delimiter", text.text, text.pos - 1))
+            if text.skip():
+                raise text.locate(
+                    JSONDecodeError('Extra data', text.text, text.pos))
+        else:
+            while text.skip():
+                yield text.decode(decoder)
+    return iterload
+
+
+class ChunkedText:
+    '''
+    Text read incrementally from a file-like object.  ``text[pos:]`` is the
+    unparsed input; consumed text is discarded as more is read (but counted,
+    so that errors can be located in the whole input).
+    '''
+    
+    def __init__(self, fp, chunk_size):
+        self._fp = fp
+        self._chunk_size = chunk_size
+        self._decoder = None
+        self._offset = 0  # characters discarded
+        self._lines = 0   # newlines discarded
+        self._column = 0  # characters discarded since the last newline
+        self.text = ''
+        self.pos = 0
+        self.eof = False
+        
+    def more(self, size=None):
+        '''
+        Read more text, returning false at the end of the input.
+        '''
+        while not self.eof:
+            raw = self._fp.read(size or self._chunk_size)
+            self.eof = not raw
+            if isinstance(raw, (bytes, bytearray)):
+                if self._decoder is None:
+                    self._decoder = getincrementaldecoder(detect_encoding(raw))()
+                chunk = self._decoder.decode(raw, final=self.eof)
+            else:
+                chunk = raw
+            if chunk:
+                self._discard()
+                self.text = self.text[self.pos:] + chunk
+                self.pos = 0
+                return True
+        return False
+    
+    def _discard(self):
+        consumed = self.text[:self.pos]
+        lines = consumed.count('\n')
+        if lines:
+            self._lines += lines
+            self._column = len(consumed) - consumed.rindex('\n') - 1
+        else:
+            self._column += len(consumed)
+        self._offset += len(consumed)
+        
+    def locate(self, err):
+        '''
+        Correct the position of a ``JSONDecodeError`` raised for the current
+        text so that it is relative to the whole input (returns the error).
+        '''
+        if err.lineno == 1:
+            err.colno += self._column
+        err.lineno += self._lines
+        err.pos += self._offset
+        err.args = ('%s: line %d column %d (char %d)' % 
+                    (err.msg, err.lineno, err.colno, err.pos),)
+        return err
+    
+    def skip(self, _w=WHITESPACE.match):
+        '''
+        Skip whitespace, returning the next character (empty at the end of
+        the input).
+        '''
+        while True:
+            self.pos = _w(self.text, self.pos).end()
+            if self.pos < len(self.text) or not self.more():
+                return self.text[self.pos:self.pos + 1]
+            
+    def decode(self, decoder):
+        '''
+        Decode the next value.  If it may be incomplete (an error, or a 
+        value that ends with the text, like a number split across chunks) 
+        then read more and try again, with reads growing geometrically so 
+        that large values are not parsed too often.
+        '''
+        size = self._chunk_size
+        while True:
+            self.skip()
+            try:
+                (value, end) = decoder.raw_decode(self.text, self.pos)
+                # a number may continue in the next chunk (eg '1.' or '1.5e')
+                if self.eof or (end < len(self.text) and
+                                self.text[end] not in '0123456789.eE+-'):
+                    self.pos = end
+                    return value
+            except JSONDecodeError as err:
+                if self.eof: raise self.locate(err)
+            self.more(size)
+            size *= 2
+            
+
+def make_load_lines(spec, skip_errors=False, on_error=None, single_pass=False):
+    '''
+    Create a function that reads JSON Lines (NDJSON) from a file-like object
+    (text or bytes), yielding one decoded value per line.  Blank lines are
+    ignored.
+
+    :param spec: The type specification for each line.  
+    :param skip_errors: If true, lines that cannot be parsed (a 
+                        ``ValueError``) or decoded (a ``TypeError``, 
+                        including ``DecodeError``) are skipped (otherwise 
+                        the error is raised).  Any other ``Exception`` (eg. 
+                        from a constructor) is treated as a ``DecodeError``
+                        for the line.
+    :param on_error: If given, called with the line number (from 1), the 
+                     line and the exception for each line skipped.
+    :param single_pass: If true, decode while parsing (see 
+                        `make_JSONDecoder()`).
+    :return: A function that takes a file-like object (and any additional
+             arguments for the ``JSONDecoder`` class) and returns a 
+             generator of values structured as ``spec``.
+
+      >>> from io import StringIO
+      >>> load_lines = make_load_lines({'a': int}, skip_errors=True,
+      ...                              on_error=lambda n, l, e: print(n, e))
+      >>> list(load_lines(StringIO('{"a": 1}\\n{"b": 2}\\n\\n{"a": 3}\\n')))
+      2 Missing value for a
+      [{'a': 1}, {'a': 3}]
+    '''
+    cls = make_JSONDecoder(spec, single_pass=single_pass)
+    def load_lines(fp, **kargs):
+        decode = cls(**kargs).decode
+        for (number, line) in enumerate(fp, 1):
+            if isinstance(line, (bytes, bytearray)):
+                line = line.decode('utf8')
+            if line.strip():
+                try:
+                    value = decode(line)
+                except (ValueError, TypeError) as e:
+                    error = e
+                except Exception as e:
+                    error = DecodeError('Cannot decode line {}: {!r}'.format(
+                                            number, e))
+                    error.__cause__ = e
+                else:
+                    yield value
+                    continue
+                if not skip_errors: raise error
+                if on_error: on_error(number, line, error)
+    return load_lines
+
+
+def make_loads(spec, single_pass=False):
     '''
     Create a replacement for the ``loads()`` function in Python's json package
     that will deserialize a string containing a JSON document to a Python
@@ -141,6 +601,8 @@ def make_loads(spec):
     :param spec: The type specification for the root object.  Nested objects
                  are defined by type annotations.  See :ref:`decoding` for
                  full details.
+    :param single_pass: If true, decode while parsing (see 
+                        `make_JSONDecoder()`).
     :return: A replacement for ``loads()`` in the Python json package, which will
              read from a string are return the data structured as ``spec``.
 
@@ -163,33 +625,235 @@ def make_loads(spec):
     (note that here, because ``Container`` uses ``*args``, it is represented as
     a list, not a dict).
     '''
-    cls = make_JSONDecoder(spec)
+    cls = make_JSONDecoder(spec, single_pass=single_pass)
     def loads(s, **kargs):
         return loads_(s, cls=cls, **kargs)
     return loads
 
 
-def make_JSONDecoder(spec):
+def decode_many(documents, spec, workers=None, chunksize=100, lines=False,
+                single_pass=False):
+    '''
+    Decode many JSON documents, spreading the work across processes, and 
+    return a list of the values (in the same order).
+    
+    The spec is sent to the worker processes, so any classes it references
+    must be importable (defined at the top level of a module) and it cannot
+    include ``Delayed()`` specs.  Decoded values are returned by pickling, 
+    so must also be picklable.
+
+    :param documents: The JSON documents (strings).
+    :param spec: The type specification for each document (or, if ``lines``
+                 is true, for each line).
+    :param workers: The number of processes (by default, the number of 
+                    CPUs).  If this is 1, or there is only a single chunk of
+                    documents, the work is done here, with no processes.
+    :param chunksize: The number of documents sent to a process at once.
+    :param lines: If true, each document is JSON Lines (several values, one
+                  per line) and the values from all lines are returned.
+    :param single_pass: If true, decode while parsing (see 
+                        `make_JSONDecoder()`).
+    :return: A list of values structured as ``spec``.
+    
+      >>> decode_many(['[1, 2]', '[3]'], [int])
+      [[1, 2], [3]]
+    '''
+    documents = iter(documents)
+    chunks = iter(lambda: list(islice(documents, chunksize)), [])
+    first = list(islice(chunks, 2))
+    chunks = chain(first, chunks)
+    if workers == 1 or len(first) < 2:
+        loads = make_loads(spec, single_pass=single_pass)
+        return [value for chunk in chunks 
+                for value in _decode_chunk((None, chunk, lines, None), loads)]
+    try:
+        description = portable_spec(spec)
+        pickle(description)
+    except (PicklingError, AttributeError, TypeError) as e:
+        raise DecodeError('Spec {} cannot be sent to worker processes ({}); '
+                          'classes must be importable'.format(spec, e))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        jobs = ((description, chunk, lines, single_pass) for chunk in chunks)
+        return [value for chunk in executor.map(_decode_chunk, jobs)
+                for value in chunk]
+
+
+def _decode_chunk(job, loads=None):
+    '''
+    Decode a chunk of documents (called in worker processes).
+    '''
+    (description, documents, lines, single_pass) = job
+    if loads is None:
+        loads = make_loads(restore_spec(description), single_pass=single_pass)
+    if lines:
+        return [loads(line) 
+                for document in documents 
+                for line in document.splitlines() if line.strip()]
+    else:
+        return [loads(document) for document in documents]
+
+
+def make_JSONDecoder(spec, single_pass=False):
     '''
     Create a custom decoder for the Python json module.
 
     :param spec: The type specification for the root object.  Nested objects
                  are defined by type annotations.  See :ref:`decoding` for
                  full details.
+    :param single_pass: If true, records, sequences and classes are decoded
+                        as they are parsed, so intermediate dicts and lists
+                        are discarded immediately, rather than the whole 
+                        document being parsed and then decoded (this is 
+                        ignored if an ``object_hook`` or 
+                        ``object_pairs_hook`` is given).
     :return: A replacement for the ``JSONDecoder`` class in the Python json 
              package, which returns data structured as ``spec``.
+             
+      >>> class Example():
+      ...     def __init__(self, foo):
+      ...         self.foo = foo
+      ...     def __repr__(self):
+      ...         return '<Example({0})>'.format(self.foo)
+      >>> loads = make_loads([Example], single_pass=True)
+      >>> loads('[{"foo": "abc"}, {"foo": [1, 2]}]')
+      [<Example(abc)>, <Example([1, 2])>]
     '''
+    
+    decode = make_decoder(spec)
 
     class JSONDecoder(JSONDecoder_):
         
-        def raw_decode(self, *args, **kargs):
+        def raw_decode(self, s, idx=0):
+            if single_pass and not (self.object_hook or self.object_pairs_hook):
+                return PlanScanner(self)(decode, s, idx)
             (decoded, index) = \
-                super(JSONDecoder, self).raw_decode(*args, **kargs)
-            return (decode(decoded, spec), index)
+                super(JSONDecoder, self).raw_decode(s, idx)
+            return (decode(decoded), index)
 
     return JSONDecoder
 
 
+class PlanScanner:
+    '''
+    Parse JSON guided by a decoder plan (see `make_decoder()`).  Objects and
+    arrays that the plan will decode are parsed here, so that their contents
+    are decoded as they are read; anything else is parsed by the scanner of
+    the given ``JSONDecoder`` and then decoded.
+    '''
+    
+    def __init__(self, decoder):
+        self._scan_once = decoder.scan_once
+        self._strict = decoder.strict
+        
+    def __call__(self, plan, s, idx):
+        try:
+            return self.value(plan, s, idx)
+        except StopIteration as err:
+            raise JSONDecodeError('Expecting value', s, err.value) from None
+        except JSONDecodeError:
+            raise
+        except Exception:
+            # values are decoded as they are read, so malformed input can 
+            # fail to decode before the parser reaches the error
+            self.check(s, idx)
+            raise
+        
+    def check(self, s, idx):
+        '''
+        Raise ``JSONDecodeError`` if the value at ``idx`` is malformed.
+        '''
+        try:
+            self._scan_once(s, idx)
+        except StopIteration as err:
+            raise JSONDecodeError('Expecting value', s, err.value) from None
+        
+    def value(self, plan, s, end, _w=WHITESPACE.match, _ws=WHITESPACE_STR):
+        while isinstance(plan, DelayedNode):
+            plan = plan.plan
+        if s[end:end + 1] in _ws: end = _w(s, end).end()
+        if plan is not IDENTITY:
+            nextchar = s[end:end + 1]
+            if nextchar == '{':
+                if isinstance(plan, RecNode):
+                    return self.object(plan, s, end + 1)
+                elif isinstance(plan, Construct) and isinstance(plan.rec, RecNode):
+                    (kargs, end) = self.object(plan.rec, s, end + 1)
+                    return (plan.cls(**kargs), end)
+            elif nextchar == '[':
+                if isinstance(plan, SeqNode):
+                    if plan.item is not IDENTITY:
+                        return self.array(plan, s, end + 1)
+                elif isinstance(plan, RecNode):
+                    return self.array(plan, s, end + 1)
+                elif isinstance(plan, Construct) and isinstance(plan.seq, RecNode):
+                    (args, end) = self.array(plan.seq, s, end + 1)
+                    return (plan.cls(*list(plan.to_list(args))), end)
+        (value, end) = self._scan_once(s, end)
+        return (plan(value), end)
+            
+    def object(self, plan, s, end, _w=WHITESPACE.match, _ws=WHITESPACE_STR):
+        result, extras = {}, []
+        if s[end:end + 1] in _ws: end = _w(s, end).end()
+        nextchar = s[end:end + 1]
+        if nextchar == '}':
+            return (plan.complete(result, extras), end + 1)
+        while True:
+            if nextchar != '"':
+                raise JSONDecodeError(
+                    'Expecting property name enclosed in double quotes', s, end)
+            (key, end) = scanstring(s, end + 1, self._strict)
+            if s[end:end + 1] in _ws: end = _w(s, end).end()
+            if s[end:end + 1] != ':':
+                raise JSONDecodeError("Expecting ':' delimiter", s, end)
+            end += 1
+            if s[end:end + 1] in _ws: end = _w(s, end).end()
+            child = plan.child(key)
+            if child is IDENTITY:
+                (result[key], end) = self._scan_once(s, end)
+            elif child is None:
+                extras.append(key)
+                (_, end) = self._scan_once(s, end)
+            else:
+                (result[key], end) = self.value(child, s, end)
+            if s[end:end + 1] in _ws: end = _w(s, end).end()
+            nextchar = s[end:end + 1]
+            if nextchar == '}':
+                return (plan.complete(result, extras), end + 1)
+            elif nextchar != ',':
+                raise JSONDecodeError("Expecting ',' delimiter", s, end)
+            end += 1
+            if s[end:end + 1] in _ws: end = _w(s, end).end()
+            nextchar = s[end:end + 1]
+    
+    def array(self, plan, s, end, _w=WHITESPACE.match, _ws=WHITESPACE_STR):
+        # a SeqNode gives a list; a RecNode a record indexed by position
+        seq = isinstance(plan, SeqNode)
+        result, extras = [] if seq else {}, []
+        if s[end:end + 1] in _ws: end = _w(s, end).end()
+        if s[end:end + 1] == ']':
+            return (result if seq else plan.complete(result, extras, True), end + 1)
+        index = 0
+        while True:
+            if seq:
+                (value, end) = self.value(plan.item, s, end)
+                result.append(value)
+            else:
+                child = plan.child(index)
+                if child is None:
+                    extras.append(str(index))
+                    (_, end) = self.value(IDENTITY, s, end)
+                else:
+                    (result[index], end) = self.value(child, s, end)
+                index += 1
+            if s[end:end + 1] in _ws: end = _w(s, end).end()
+            nextchar = s[end:end + 1]
+            if nextchar == ']':
+                return (result if seq else plan.complete(result, extras, True), end + 1)
+            elif nextchar != ',':
+                raise JSONDecodeError("Expecting ',' delimiter", s, end)
+            end += 1
+
+
 if __name__ == "__main__":
     import doctest
     print(doctest.testmod())
@@ -26,10 +26,19 @@
 # above, a recipient may use your version of this file under either the
 # MPL or the LGPL License.
 
+from contextlib import contextmanager
+
 try:
-    from yaml import safe_dump, safe_dump_all, safe_load, safe_load_all
+    from yaml import safe_dump, safe_dump_all, safe_load, safe_load_all, \
+        emit, SafeDumper, StreamStartEvent, StreamEndEvent, \
+        DocumentStartEvent, DocumentEndEvent, MappingStartEvent, \
+        MappingEndEvent, SequenceStartEvent, SequenceEndEvent, ScalarEvent, \
+        ScalarNode
+    from yaml.representer import SafeRepresenter
+    from yaml.resolver import Resolver
 
-    from pytyp.s11n.base import encode, decode
+    from pytyp.s11n.base import Encoder, EncodeError, encode, make_decoder, \
+        BufferReader
     
     
     def dump(data, stream=None, **kargs):
@@ -98,6 +107,78 @@ try:
                              stream=stream, **kargs)
     
     
+    def iterencode(data, default_flow_style=False):
+        '''
+        Generate the PyYAML events for `data`, encoding objects as they are 
+        reached (unlike `dump()`, no encoded copy of the whole of `data` is
+        constructed).
+        
+        :param data: The Python object (or collection) to encode.
+        :param default_flow_style: If true, use flow style for all 
+                                   collections.
+        :return: A generator of PyYAML events for a single document.
+        
+          >>> from yaml import emit
+          >>> emit(iterencode({'a': [1, 'b']}, default_flow_style=True))
+          '{a: [1, b]}\\n'
+        '''
+        representer, resolver = SafeRepresenter(), Resolver()
+        flow_style = bool(default_flow_style)
+        
+        def scalar(value):
+            node = representer.represent_data(value)
+            if not isinstance(node, ScalarNode):
+                raise EncodeError('Cannot stream {}'.format(value))
+            implicit = (node.tag == resolver.resolve(ScalarNode, node.value, (True, False)),
+                        node.tag == resolver.resolve(ScalarNode, node.value, (False, True)))
+            return ScalarEvent(None, node.tag, implicit, node.value, style=node.style)
+        
+        ends = []
+        yield StreamStartEvent()
+        yield DocumentStartEvent()
+        for (kind, value) in Encoder().events(data):
+            if kind == 'atomic' or kind == 'key':
+                yield scalar(value)
+            elif kind == 'map':
+                ends.append(MappingEndEvent)
+                yield MappingStartEvent(None, None, True, flow_style=flow_style)
+            elif kind == 'list':
+                ends.append(SequenceEndEvent)
+                yield SequenceStartEvent(None, None, True, flow_style=flow_style)
+            else:
+                yield ends.pop()()
+        yield DocumentEndEvent()
+        yield StreamEndEvent()
+        
+        
+    def dump_stream(data, stream=None, default_flow_style=False, **kargs):
+        '''
+        Serialize `data` as a YAML formatted stream (or return a string), as
+        `dump()`, but emitting the YAML while the data are encoded, so that
+        memory use depends on the depth, rather than the size, of `data`.
+        Keys are not sorted.
+        
+        :param data: The Python object (or collection) to encode.
+        :param stream: The destination for the data.
+        :param default_flow_style: If true, use flow style for all 
+                                   collections.
+        :param kargs: Additional parameters are passed directly to `emit()`
+                      in PyYAML (eg. `indent`, `width`).
+        :return: A string containing YAML encoded `data` if `stream` is 
+                 `None`; otherwise `None` (output written to `stream`).
+                 
+          >>> class Example():
+          ...     def __init__(self, foo, bar):
+          ...         self.foo = foo
+          ...         self.bar = bar
+          >>> print(dump_stream([Example('abc', 1)]), end='')
+          - foo: abc
+            bar: 1
+        '''
+        return emit(iterencode(data, default_flow_style=default_flow_style),
+                    stream=stream, Dumper=SafeDumper, **kargs)
+    
+    
     def make_load(spec):
         '''
         Create a replacement for the `load()` function in pyyaml that will
@@ -107,12 +188,17 @@ try:
                      objects are defined by type annotations.  See
                      :ref:`decoding` for full details.
         :return: A replacement for `load()` in the PyYAML package which
-                 returns data structure as `spec`.
+                 returns data structure as `spec`.  This also accepts a 
+                 path (eg. ``pathlib.Path``, but not a string, which is 
+                 YAML), ``bytes``, ``bytearray`` or ``memoryview``, which
+                 are read and decoded in chunks.
 
         The documentation for `dump()` above contains an example of use.
         '''
+        decode = make_decoder(spec)
         def load(stream, **kargs):
-            return decode(safe_load(stream, **kargs), spec)
+            with _binary(stream) as stream:
+                return decode(safe_load(stream, **kargs))
         return load
     
     
@@ -126,14 +212,31 @@ try:
                      objects.  Nested objects are defined by type annotations.
                      See :ref:`decoding` for full details.
         :return: A replacement for `load_all()` in the PyYAML package which
-                 returns data structure as `spec`.
+                 returns data structure as `spec` (and accepts the same
+                 sources as `make_load()`).
 
         The documentation for `dump_all()` above contains an example of use.
         '''
         def load_all(stream, **kargs):
-            for (s, d) in zip(spec, safe_load_all(stream, **kargs)):
-                yield decode(d, s)
+            with _binary(stream) as stream:
+                for (s, d) in zip(spec, safe_load_all(stream, **kargs)):
+                    yield make_decoder(s)(d)
         return load_all
+    
+    
+    @contextmanager
+    def _binary(stream):
+        '''
+        PyYAML reads and decodes file-like objects in chunks, so paths are 
+        opened in binary mode and bytes are read through a ``BufferReader``.
+        '''
+        if isinstance(stream, (bytes, bytearray, memoryview)):
+            yield BufferReader(memoryview(stream))
+        elif hasattr(stream, '__fspath__'):
+            with open(stream, 'rb') as file:
+                yield file
+        else:
+            yield stream
 
 except ImportError:
 
@@ -146,6 +249,12 @@ except ImportError:
     def dump_all(data, stream=None, **kargs):
         _lazy()
 
+    def iterencode(data, default_flow_style=False):
+        _lazy()
+
+    def dump_stream(data, stream=None, default_flow_style=False, **kargs):
+        _lazy()
+
     def make_load(spec):
         _lazy()
 
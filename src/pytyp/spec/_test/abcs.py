@@ -334,6 +334,20 @@ class AndTest(TestCase):
         
         assert isinstance(ifoo, Cls(Foo, x=int))
         
+    def test_subclass(self):
+        # a failed structural check does not hide normal subclasses (these 
+        # were all False when __subclasshook__ returned the failed check)
+        spec = And(Atr(a=int), Rec(a=int))
+        class Sub(spec): pass
+        assert issubclass(Sub, spec)
+        assert issubclass(spec, spec)
+        class Foo: pass
+        class Bar(Foo): pass
+        spec = And(Cls(Foo), Atr(x=int))
+        spec.register(Bar)
+        assert issubclass(Bar, spec)
+        assert not issubclass(Foo, spec)
+        
         
 class OrTest(TestCase):
     
@@ -26,10 +26,15 @@
 # above, a recipient may use your version of this file under either the
 # MPL or the LGPL License.
 
+from abc import ABC, abstractmethod
+from copy import copy, deepcopy
+from pickle import dumps, loads
 from unittest import TestCase
+from weakref import ref
 
-from pytyp.spec.abcs import Delayed, Alt
-from pytyp.spec.future import TypedProperty, Typed
+from pytyp.spec.abcs import Delayed, Alt, ANY
+from pytyp.spec.future import TypedProperty, Typed, TypedDict, TypedValue, \
+    VersionedList, VersionedDict, deep_version
 from pytyp.spec.check import checked
 
 
@@ -201,3 +206,211 @@ class TypedTest(TestCase):
             assert False, 'Expected error'
         except TypeError:
             pass
+
+    def test_storage(self):
+        
+        class C(Typed):
+            a = TypedProperty(int)
+            b = TypedProperty(1, int)
+            
+        class D(C):
+            c = TypedProperty('x', str)
+            
+        d = D()
+        assert d.__dict__ == {}, d.__dict__
+        d.a = 2
+        assert d.__dict__ == {'a': 2}, d.__dict__
+        assert d.b == 1 and d.c == 'x'
+        assert d.p.b.value == 1 and d.p.c.spec is str
+        d.p.b.value = 3
+        assert d.b == 3, d.b
+        try:
+            D().a
+            assert False, 'Expected error'
+        except TypeError:
+            pass
+        try:
+            d.p.d
+            assert False, 'Expected error'
+        except AttributeError:
+            pass
+        assert repr(d.p.c) == "BoundProperty(name='c', value='x', spec=<class 'str'>)"
+        
+    def test_abc(self):
+        
+        class C(Typed, ABC):
+            a = TypedProperty(int)
+            @abstractmethod
+            def f(self): pass
+            
+        class D(C):
+            def f(self): return self.a
+            
+        try:
+            C()
+            assert False, 'Expected error'
+        except TypeError:
+            pass
+        d = D()
+        d.a = 1
+        assert d.f() == 1 and isinstance(d, C)
+
+
+class TypedDictTest(TestCase):
+    
+    def test_raw(self):
+        td = TypedDict(a=1, b=TypedValue('two', str))
+        assert dict.__getitem__(td, 'a') == 1
+        assert dict.__getitem__(td, 'b') == 'two'
+        assert dict(td) == {'a': 1, 'b': 'two'}, dict(td)
+        assert list(sorted(td.values(), key=str)) == [1, 'two']
+        assert td.typed_get('a').spec is ANY
+        assert td.typed_get('b').spec is str
+        assert td.typed_get('c', None) is None
+        
+    def test_removal(self):
+        td = TypedDict(a=TypedValue(1, int), b=TypedValue('two', str))
+        assert td.pop('a') == 1
+        td['a'] = 'one'
+        assert td.setdefault('b', 'x') == 'two'
+        try:
+            td['b'] = 2
+            assert False, 'Expected error'
+        except TypeError:
+            pass
+        td.clear()
+        td['b'] = 2
+        assert td.typed_get('b').spec is ANY
+        
+    def test_copy(self):
+        td = TypedDict(a=TypedValue(1, int))
+        td2 = td.copy()
+        assert isinstance(td2, TypedDict)
+        try:
+            td2['a'] = 'one'
+            assert False, 'Expected error'
+        except TypeError:
+            pass
+        
+    def test_pickle(self):
+        td = TypedDict(a=TypedValue(1, int), b=[2])
+        for td2 in (loads(dumps(td)), copy(td), deepcopy(td)):
+            assert td2 == td and type(td2) is TypedDict
+            assert td2.typed_get('a').spec is int
+            try:
+                td2['a'] = 'one'
+                assert False, 'Expected error'
+            except TypeError:
+                pass
+            td2['c'] = TypedValue(3, int)
+            assert 'c' not in td and td.typed_get('b').spec is ANY
+        assert copy(td)['b'] is td['b'] and deepcopy(td)['b'] is not td['b']
+        
+    def test_slots(self):
+        td = TypedDict(a=TypedValue(1, int))
+        assert ref(td)() is td
+        try:
+            td.foo = 1
+            assert False, 'Expected error'
+        except AttributeError:
+            pass
+        value = td.typed_get('a')
+        value.value = 2
+        assert td['a'] == 1
+
+    def test_update(self):
+        td = TypedDict(a=TypedValue(1, int), b='two')
+        td.update([('a', 2), ('c', TypedValue(3.0, float)), ('c', 4.0)])
+        assert td == {'a': 2, 'b': 'two', 'c': 4.0}, td
+        try:
+            td.update(TypedDict(d=5, c=TypedValue('x', str)), a='one')
+            assert False, 'Expected error'
+        except TypeError:
+            pass
+        assert td == {'a': 2, 'b': 'two', 'c': 4.0}, td
+        try:
+            td.update([('b', TypedValue('x', str)), ('b', 6)])
+            assert False, 'Expected error'
+        except TypeError:
+            pass
+        assert td == {'a': 2, 'b': 'two', 'c': 4.0}, td
+        td.update(TypedDict(c=TypedValue('x', str)))
+        try:
+            td['c'] = 7.0
+            assert False, 'Expected error'
+        except TypeError:
+            pass
+
+
+class LazyTest(TestCase):
+    
+    def test_nested(self):
+        inner = VersionedDict(a=1)
+        tv = TypedValue(VersionedList([inner]), [{'a': int}], lazy=True)
+        outer = tv.value
+        version = deep_version(outer)
+        assert version == deep_version(outer)
+        inner['a'] = 'one'
+        assert version != deep_version(outer)
+        try:
+            tv.value
+            assert False, 'Expected error'
+        except TypeError:
+            pass
+        inner['a'] = 2
+        assert tv.value[0]['a'] == 2
+        
+    def test_in_place(self):
+        values = VersionedList([1])
+        for modify in (lambda: values.__iadd__([2]), lambda: values.__imul__(2)):
+            version = deep_version(values)
+            modify()
+            assert version != deep_version(values)
+        values = VersionedDict(a=1)
+        version = deep_version(values)
+        values |= {'b': 2}
+        assert version != deep_version(values)
+        tv = TypedValue(VersionedDict(a=1), {'a': int}, lazy=True)
+        tv.value |= {'a': 'one'}
+        try:
+            tv.value
+            assert False, 'Expected error'
+        except TypeError:
+            pass
+        
+    def test_propagate(self):
+        leaf = VersionedList([1])
+        middle = VersionedDict(a=(leaf, 2))
+        root = VersionedList([middle, VersionedList([3])])
+        version = deep_version(root)
+        assert version == deep_version(root)
+        leaf.append(4)
+        assert version != deep_version(root)
+        version = deep_version(root)
+        leaf.append([5]) # not versioned, so no longer tracked
+        assert deep_version(root) is None and deep_version(root) is None
+        leaf.pop()
+        assert deep_version(root) not in (None, version)
+        root.append(root)
+        version = deep_version(root)
+        assert version == deep_version(root)
+        
+    def test_pickle(self):
+        values = VersionedList([VersionedDict(a=1)])
+        deep_version(values)
+        for copied in (loads(dumps(values)), deepcopy(values)):
+            assert copied == values and type(copied[0]) is VersionedDict
+            version = deep_version(copied)
+            copied[0]['b'] = 2
+            assert version != deep_version(copied)
+        
+    def test_deferred(self):
+        tv = TypedValue('one', int, lazy=True)
+        tv.value = 2
+        assert tv.value == 2
+        tv.value = 'two'
+        try:
+            tv.value
+            assert False, 'Expected error'
+        except TypeError:
+            pass
@@ -26,16 +26,28 @@
 # above, a recipient may use your version of this file under either the
 # MPL or the LGPL License.
 
+from array import array
+from collections.abc import Mapping
+from copy import copy, deepcopy
+import marshal
+from os import listdir, chmod, replace
+from os.path import join
+from pickle import dumps, loads
+from tempfile import TemporaryDirectory
 from unittest import TestCase
 
-from pytyp.spec.record import record, parse_args
-from pytyp.spec.abcs import Seq
+from pytyp.spec.record import record, parse_args, set_cache_dir, _record_cache, \
+    RecordArray
+from pytyp.spec.abcs import Seq, Rec, Alt, Opt, Atr, ANY
 import pytyp.spec.abcs as abcs
+import pytyp.spec.record as record_module
 
 
 def foo(a:int=6): return a
 #def foo(a=6:int): return a
 
+Pickled = record('Pickled', 'a:int,b:str="x"')
+
 
 class ParseArgsTest(TestCase):
     
@@ -54,6 +66,20 @@ class ParseArgsTest(TestCase):
         self.assert_parse('a:int=1,,', "OrderedDict([('a', (int, '1')), (0, (Cls(object), None)), (1, (Cls(object), None))])")
         self.assert_parse('a:int,b:Rec(Seq(Opt(int)))', "OrderedDict([('a', (int, None)), ('b', (Rec(Seq(Opt(int))), None))])")
         self.assert_parse('a:str,__:int', "OrderedDict([('a', (str, None)), ('__', (int, None))])")
+        self.assert_parse(' a : int = 1 ,\n b:Seq(str)', "OrderedDict([('a', (int, '1')), ('b', (Seq(str), None))])")
+        self.assert_parse('a:str="x,y"', "OrderedDict([('a', (str, '\"x,y\"'))])")
+        
+    def test_errors(self):
+        for (input, column) in (('a b', 2), ('a:int:str', 5), ('a=1=2', 3),
+                                ('a:int=', 6), ('a:Seq(int', 9), ('a:Seq(*)', 7),
+                                ('a:int=1 b', 8), ('a:int=1,b=f(x y)', 12),
+                                ('a:int # c', 6), ('a, # c\nb', 3)):
+            try:
+                parse_args(input, abcs.__dict__)
+                assert False, 'Expected error'
+            except ValueError as e:
+                assert 'Cannot parse' in str(e), e
+                assert 'column {}'.format(column) in str(e), e
                           
                           
 class RecordTest(TestCase):
@@ -134,4 +160,336 @@ class RecordTest(TestCase):
     def test_str_tuple(self):
         StrTuple = record('StrTuple', ':str,:str')
         stuple = StrTuple('foo', 'bar')
-        
\ No newline at end of file
+
+    def test_assignment(self):
+        Record = record('Record', 'a:int,:str,__:float', mutable=True)
+        r = Record(1, 'one')
+        r._0 = 'two'
+        assert r[0] == 'two', r
+        r.a = 2
+        assert r.a == 2 and r['a'] == 2, r
+        assert 'a' not in r.__dict__, r.__dict__
+        r['a'] = 3
+        assert r.a == 3, r.a
+        r.c = 1.0
+        assert r.c == 1.0, r
+        for (name, value) in (('a', 'two'), ('_0', 2), ('c', 1)):
+            try:
+                setattr(r, name, value)
+                assert False, 'Expected error'
+            except TypeError:
+                pass
+        try:
+            r.d
+            assert False, 'Expected error'
+        except AttributeError:
+            pass
+        
+
+class CacheTest(TestCase):
+    
+    def test_same_class(self):
+        Record1 = record('Record', 'a:int,b:Seq(str)')
+        Record2 = record('Record', 'a:int,b:Seq(str)')
+        assert Record1 is Record2
+        Record3 = record('Record', 'a:int,b:Seq(str)', mutable=True)
+        assert Record1 is not Record3
+        
+    def test_module(self):
+        Record1 = record('Record', 'a:int', module='foo')
+        Record2 = record('Record', 'a:int', module='bar')
+        assert Record1 is not Record2
+        assert Record1.__module__ == 'foo' and Record2.__module__ == 'bar'
+        assert record('Record', 'a:int', module='foo') is Record1
+        
+    def test_lru(self):
+        size = record_module._record_cache_size
+        record_module._record_cache_size = 2
+        try:
+            _record_cache.clear()
+            Record1 = record('Record', 'a:int')
+            Record2 = record('Record', 'b:int')
+            assert record('Record', 'a:int') is Record1
+            record('Record', 'c:int')
+            assert len(_record_cache) == 2
+            assert record('Record', 'a:int') is Record1
+            assert record('Record', 'b:int') is not Record2
+        finally:
+            record_module._record_cache_size = size
+            
+    def test_error_context(self):
+        try:
+            record('Record', 'a:int,b:Missing')
+            assert False, 'Expected error'
+        except NameError as e:
+            assert not isinstance(e.__context__, KeyError), e.__context__
+        
+    def test_unhashable_context(self):
+        Record1 = record('Record', 'a:Foo', context={'Foo': int, 'x': []})
+        Record2 = record('Record', 'a:Foo', context={'Foo': int, 'x': []})
+        assert Record1 is not Record2
+        assert Record1(1).a == 1
+        
+    def test_disk_cache(self):
+        calls = []
+        def counted(function):
+            def wrapper(*args, **kargs):
+                calls.append(function.__name__)
+                return function(*args, **kargs)
+            return wrapper
+        with TemporaryDirectory() as directory:
+            set_cache_dir(directory)
+            try:
+                Record = record('DiskRecord', 'a:int,b:str="x"')
+                assert listdir(directory)
+                _record_cache.clear()
+                record_module.parse_args = counted(parse_args)
+                record_module.compile = counted(compile)
+                Record2 = record('DiskRecord', 'a:int,b:str="x"')
+                assert not calls, calls # a cache hit
+                assert Record2 is not Record
+                assert Record2(1).b == 'x'
+                record('DiskRecord2', 'a:int')
+                assert 'parse_args' in calls and 'compile' in calls, calls
+            finally:
+                set_cache_dir(None)
+                record_module.parse_args = parse_args
+                del record_module.compile
+                _record_cache.clear()
+                
+    def test_failed_write(self):
+        def fail(*args):
+            raise OSError('full')
+        with TemporaryDirectory() as directory:
+            set_cache_dir(directory)
+            try:
+                record_module.replace = fail
+                assert record('DiskRecord', 'a:int')(1).a == 1
+                assert not listdir(directory)
+            finally:
+                set_cache_dir(None)
+                record_module.replace = replace
+                _record_cache.clear()
+                
+    def test_untrusted_cache(self):
+        with TemporaryDirectory() as directory:
+            set_cache_dir(directory)
+            try:
+                record('DiskRecord', 'a:int')
+                (name,) = listdir(directory)
+                path = join(directory, name)
+                def inject():
+                    with open(path, 'wb') as output:
+                        output.write(marshal.dumps(
+                            ('', compile('raise ValueError', '', 'exec'))))
+                    _record_cache.clear()
+                inject()
+                try:
+                    record('DiskRecord', 'a:int')
+                    assert False, 'Expected error'
+                except ValueError:
+                    pass
+                for (target, mode) in ((path, 0o622), (directory, 0o777)):
+                    inject()
+                    chmod(target, mode)
+                    assert record('DiskRecord', 'a:int')(1).a == 1
+                    chmod(target, 0o700)
+            finally:
+                set_cache_dir(None)
+                _record_cache.clear()
+
+
+class BulkTest(TestCase):
+    
+    def test_rows(self):
+        Record = record('Record', 'a:int,b:str="x",__:float')
+        (r1, r2, r3) = Record._from_rows([(1, 'one'), {'a': 2, 'c': 1.5}, (3,)])
+        assert r1 == {'a': 1, 'b': 'one'}, r1
+        assert r2 == {'a': 2, 'b': 'x', 'c': 1.5}, r2
+        assert r3 == Record(3), r3
+        assert r2.c == 1.5
+        assert isinstance(r1, Record)
+        try:
+            Record._from_rows([(1, 'one'), ('two',)])
+            assert False, 'Expected error'
+        except TypeError:
+            pass
+        try:
+            Record._from_rows([{'b': 'one'}])
+            assert False, 'Expected error'
+        except TypeError:
+            pass
+        
+    def test_columns(self):
+        Record = record('Record', 'a:int,b:Opt(str)=None')
+        records = Record._from_columns({'a': [1, 2, 3], 'b': ['one', None, 'three']})
+        assert records == [Record(1, 'one'), Record(2), Record(3, 'three')], records
+        assert len(set(records)) == 3
+        assert Record._from_columns({'a': []}) == []
+        assert Record._from_columns({}) == []
+        assert Record._from_columns({'b': []}) == []
+        assert Record._from_rows([]) == []
+        try:
+            Record._from_columns({'a': [1, 2], 'b': ['one']})
+            assert False, 'Expected error'
+        except ValueError:
+            pass
+        try:
+            Record._from_columns({'a': [1, 2], 'c': [1, 2]})
+            assert False, 'Expected error'
+        except TypeError:
+            pass
+        
+    def test_unchecked(self):
+        Record = record('Record', 'a:int', checked=False)
+        assert Record._from_columns({'a': ['one']}) == [{'a': 'one'}]
+        
+    def test_numbered(self):
+        Pair = record('Pair', ':int,:str')
+        (pair,) = Pair._from_rows([(1, 'one')])
+        assert pair._0 == 1 and pair[1] == 'one', pair
+
+
+class RecordArrayTest(TestCase):
+    
+    def test_columns(self):
+        Record = record('Record', 'a:int,b:str="x",c:float=0.0')
+        records = RecordArray(Record, {'a': [1, 2, 3], 'c': [1.5, 2.5, 3.5]})
+        assert len(records) == 3
+        assert isinstance(records.column('a'), array)
+        assert isinstance(records.column('c'), array)
+        assert isinstance(records.column('b'), list)
+        assert records[0] == Record(1, 'x', 1.5), records[0]
+        assert records[-1].a == 3
+        assert records[1]['c'] == 2.5
+        assert records[2:][0].a == 3
+        assert len(records[::2]) == 2
+        assert [r.a for r in records.where('c', lambda c: c > 2)] == [2, 3]
+        assert records.records() == [Record(1, 'x', 1.5), Record(2, 'x', 2.5), Record(3, 'x', 3.5)]
+        assert records[0]._replace(a=4) == Record(4, 'x', 1.5)
+        try:
+            RecordArray(Record, {'a': [1, 'two']})
+            assert False, 'Expected error'
+        except TypeError:
+            pass
+        try:
+            records[3]
+            assert False, 'Expected error'
+        except IndexError:
+            pass
+        
+    def test_copy(self):
+        records = RecordArray(Pickled, {'a': [1, 2]})
+        for copied in (copy(records[1]), deepcopy(records[1]), 
+                       loads(dumps(records[1]))):
+            assert type(copied) is Pickled and copied == Pickled(2), copied
+        try:
+            records[0].__foo__
+            assert False, 'Expected error'
+        except AttributeError:
+            pass
+        
+    def test_overflow(self):
+        Record = record('Record', 'a:int')
+        records = RecordArray.from_rows(Record, [(1,), (2**70,)])
+        assert isinstance(records.column('a'), list)
+        assert records[1].a == 2**70
+        
+    def test_extra(self):
+        Record = record('Record', 'a:int,__:str')
+        records = RecordArray.from_rows(Record, [{'a': 1}, {'a': 2, 'b': 'two'}])
+        assert dict(records[0]) == {'a': 1}, records[0]
+        assert dict(records[1]) == {'a': 2, 'b': 'two'}, records[1]
+        assert isinstance(records, Seq(Record))
+        
+    def test_empty(self):
+        Record = record('Record', 'a:int,b:str="x"')
+        for records in (RecordArray(Record), RecordArray(Record, {'a': []}),
+                        RecordArray.from_rows(Record, [])):
+            assert len(records) == 0 and records.records() == []
+            assert list(records.column('a')) == []
+            assert isinstance(records, Seq(Record))
+            assert isinstance(records, Seq(int))
+        
+    def test_check(self):
+        # the same results as for a list of records
+        Record = record('Record', 'a:int,b:str')
+        records = RecordArray.from_rows(Record, [(1, 'one'), (2, 'two')])
+        for spec in (Record, Alt(int, Record), Opt(Record), dict, Mapping,
+                     Rec(a=int, b=str), Rec(a=Alt(int, float), b=ANY), 
+                     Rec(a=str, b=str), Rec(a=int), {'a': int, 'b': str}, int,
+                     Seq(Rec(a=int, b=str)), Atr(a=int), Rec(__=int)):
+            assert isinstance(records, Seq(spec)) == \
+                isinstance(records.records(), Seq(spec)), spec
+        assert isinstance(records, Seq(Record))
+        assert not isinstance(records, Seq(Seq(Rec(a=int, b=str))))
+        assert not isinstance(records, Seq(Atr(a=int)))
+        assert not isinstance(records, Seq(Rec(__=int)))
+        assert not isinstance(records, Seq(int))
+
+
+class InternTest(TestCase):
+    
+    def test_intern(self):
+        Record = record('Record', 'a:int,b:str="x",__:int', intern=True)
+        r1, r2, r3 = Record(1), Record(1, 'x'), Record(2)
+        assert r1 is r2
+        assert r1 is not r3
+        assert r1 == r2 and r1 != r3
+        assert r1 == {'a': 1, 'b': 'x'}
+        assert hash(r1) == hash(r2)
+        assert r1._replace(a=2) is r3
+        assert Record._from_rows([(2,)])[0] is r3
+        assert Record(1, c=2, d=3) is Record(1, d=3, c=2)
+        assert copy(r3) is r3
+        assert len(set([r1, r2, r3])) == 2
+        
+    def test_intern_types(self):
+        Record = record('Record', 'x', intern=True)
+        Other = record('Other', 'x')
+        assert Record(True).x is True and Record(1).x == 1
+        assert type(Record(1).x) is int
+        assert Record(1) is not Record(True) and Record(1) is not Record(1.0)
+        assert Record(1) == Record(1.0) and hash(Record(1)) == hash(Record(1.0))
+        assert {Record(1): 'a'}.get(Record(1.0)) == 'a'
+        for value in (1, True, 1.0):
+            other = Other(value)
+            assert other == Record(1) and Record(1) == other
+            assert Record(value) == {'x': 1}
+            assert hash(other) == hash(Record(1))
+        
+    def test_intern_nested(self):
+        Record = record('Record', 'x', intern=True)
+        r1 = Record((1, frozenset([2])))
+        assert Record((1, frozenset([2]))) is r1
+        r2 = Record((1.0, frozenset([2])))
+        assert r2 is not r1 and type(r2.x[0]) is float
+        r3 = Record((1, frozenset([2.0])))
+        assert r3 is not r1 and type(next(iter(r3.x[1]))) is float
+        assert r1 == r2 == r3
+        assert Record(Record(1)) is Record(Record(1))
+        assert type(Record(Record(1.0)).x.x) is float
+        
+    def test_intern_unhashable(self):
+        Record = record('Record', 'x', intern=True)
+        r1, r2 = Record([1]), Record([1])
+        assert r1 is not r2
+        assert r1 == r2 and not r1 != r2
+        assert Record([2]) != r1
+        
+    def test_intern_unknown(self):
+        # other values may be equal across types, so are not shared
+        class Value:
+            def __init__(self, x): self.x = x
+            def __eq__(self, other): return self.x == other.x
+            def __hash__(self): return hash(self.x)
+        Record = record('Record', 'x', intern=True)
+        assert Record(Value(1)) is not Record(Value(1.0))
+        assert Record(Value(1)) == Record(Value(1.0))
+        
+    def test_mutable(self):
+        try:
+            record('Record', 'a:int', mutable=True, intern=True)
+            assert False, 'Expected error'
+        except TypeError:
+            pass
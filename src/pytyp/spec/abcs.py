@@ -351,6 +351,19 @@ class Seq(Product):
         else:
             return super().__new__(cls)
 
+    @classmethod
+    def _structuralcheck(cls, instance, check=isinstance):
+        '''
+        Containers can provide ``__seqhook__(spec)`` to check their contents 
+        more efficiently (returning ``NotImplemented`` to use the default).
+        '''
+        hook = getattr(type(instance), '__seqhook__', None)
+        if hook and check is isinstance and hasattr(cls, '_abc_type_arguments'):
+            result = hook(instance, cls._abc_type_arguments[0][1])
+            if result is not NotImplemented:
+                return result
+        return super()._structuralcheck(instance, check=check)
+
     @classmethod
     def _vsn(cls, value):
         try:
@@ -785,7 +798,8 @@ class _Set(TypeSpec):
         if _Set is cls or _Set in cls.__bases__:
             return NotImplemented
         else:
-            return cls._structuralcheck(subclass, check=issubclass) 
+            # a failed structural check must not hide normal subclasses
+            return cls._structuralcheck(subclass, check=issubclass) or NotImplemented
 
     @classmethod
     def _fmt_args(cls):
@@ -29,7 +29,7 @@
 from inspect import getcallargs, getfullargspec
 from functools import wraps
 
-from pytyp.spec.abcs import type_error, normalize
+from pytyp.spec.abcs import type_error, normalize, Cls, Alt, Or, Opt
 
 
 def verify(value, spec):
@@ -41,6 +41,81 @@ def verify(value, spec):
         type_error(value, spec)
         
         
+def validator(spec):
+    '''
+    Return a function that raises a ``TypeError`` if its argument is *not* an
+    instance of ``spec``.  This avoids normalizing the spec on each call
+    and, where the spec is defined by classes, tests those directly.
+    
+      >>> check = validator(Opt(int))
+      >>> check(None)
+      >>> check('one')
+      Traceback (most recent call last):
+        ...
+      TypeError: Type Opt(int) inconsistent with 'one'.
+    '''
+    spec = normalize(spec)
+    classes = accepted_classes(spec)
+    if classes == (object,):
+        def validate(value):
+            pass
+    elif classes:
+        def validate(value):
+            if not isinstance(value, classes) and not isinstance(value, spec):
+                type_error(value, spec)
+    else:
+        def validate(value):
+            if not isinstance(value, spec):
+                type_error(value, spec)
+    return validate
+
+
+def verify_column(values, spec):
+    '''
+    Verify a collection of values against a single spec.  Where the spec
+    accepts values by class, each distinct type is checked only once.
+    
+      >>> verify_column([1, 2, 3, None], Opt(int))
+      >>> verify_column([1, 2, 'three'], int)
+      Traceback (most recent call last):
+        ...
+      TypeError: Type int inconsistent with 'three'.
+    '''
+    spec = normalize(spec)
+    classes = accepted_classes(spec)
+    if classes is None:
+        for value in values:
+            verify(value, spec)
+    else:
+        rejected = set(type_ for type_ in set(map(type, values))
+                       if not issubclass(type_, classes))
+        if rejected:
+            for value in values:
+                if type(value) in rejected:
+                    verify(value, spec)
+
+
+def accepted_classes(spec):
+    '''
+    The tuple of classes whose instances match ``spec``, or ``None`` if
+    the spec is not defined by classes alone.
+    '''
+    spec = normalize(spec)
+    mro = spec.__mro__
+    if Cls in mro:
+        return (spec._abc_class,)
+    elif (Alt in mro or Or in mro) and hasattr(spec, '_abc_type_arguments'):
+        classes = ()
+        for (_, alternative) in spec._abc_type_arguments:
+            more = accepted_classes(alternative)
+            if more is None:
+                return None
+            classes += more
+        return classes
+    else:
+        return None
+        
+        
 def verify_all(callargs, annotations):
     '''
     Helper to verify a set of values against the appropriate type annotations.sy
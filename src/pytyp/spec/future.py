@@ -26,18 +26,170 @@
 # above, a recipient may use your version of this file under either the
 # MPL or the LGPL License.
 
-from pytyp.spec.check import verify
-from pytyp.util import items
+from itertools import count
+from weakref import ref
+
+from pytyp.spec.check import verify, validator, verify_column
 from pytyp.spec.abcs import ANY
 
 
+_stamp = count(1)
+
+
+class VersionedList(list):
+    '''
+    A `list()` that records when it was last modified (see `TypedValue()`).
+    '''
+    
+    def __init__(self, *args):
+        super(VersionedList, self).__init__(*args)
+        _reset(self)
+        
+    def __reduce__(self):
+        return (self.__class__, (list(self),))
+        
+
+class VersionedDict(dict):
+    '''
+    A `dict()` that records when it was last modified (see `TypedValue()`).
+    '''
+    
+    def __init__(self, *args, **kargs):
+        super(VersionedDict, self).__init__(*args, **kargs)
+        _reset(self)
+        
+    def __reduce__(self):
+        return (self.__class__, (dict(self),))
+
+
+def _reset(container):
+    # _checked is true when the contents are known to be atomic, tuples or
+    # versioned containers that will report changes to their _parents
+    container._version = next(_stamp)
+    container._checked = False
+    container._parents = {}
+
+
+def _modified(container):
+    '''
+    Give the container, and any versioned containers that hold it, a new 
+    version (so that their contents are checked again on the next call to
+    `deep_version()`).
+    '''
+    version, pending = next(_stamp), [container]
+    while pending:
+        container = pending.pop()
+        if container._version != version:
+            container._version = version
+            container._checked = False
+            for (key, parent) in list(container._parents.items()):
+                parent = parent()
+                if parent is None:
+                    del container._parents[key]
+                else:
+                    pending.append(parent)
+
+
+def _versioned(cls, name):
+    method = getattr(cls, name)
+    def modify(self, *args, **kargs):
+        try:
+            return method(self, *args, **kargs)
+        finally:
+            _modified(self)
+    modify.__name__ = name
+    setattr(cls, name, modify)
+    
+for _name in ('__setitem__', '__delitem__', '__iadd__', '__imul__', 'append',
+              'extend', 'insert', 'pop', 'remove', 'reverse', 'sort', 'clear'):
+    _versioned(VersionedList, _name)
+for _name in ('__setitem__', '__delitem__', '__ior__', 'clear', 'pop', 
+              'popitem', 'setdefault', 'update'):
+    if hasattr(VersionedDict, _name):
+        _versioned(VersionedDict, _name)
+
+
+_ATOMIC = (type(None), bool, int, float, complex, str, bytes, type)
+
+def deep_version(value):
+    '''
+    The latest modification of ``value`` and its contents, 0 if it cannot
+    change, or ``None`` if changes cannot be detected (so it must be checked
+    on every access).
+    
+    Versioned containers report changes to the containers that hold them,
+    so the contents are only checked again after a modification (and then
+    only along the modified path).
+    
+      >>> l = VersionedList([1, (2, 3)])
+      >>> v = deep_version(l)
+      >>> v == deep_version(l)
+      True
+      >>> l.append(4)
+      >>> v == deep_version(l)
+      False
+      >>> deep_version([1, 2]) is None
+      True
+    '''
+    return _deep_version(value, None)
+
+
+def _deep_version(value, parent):
+    if isinstance(value, _ATOMIC):
+        return 0
+    elif isinstance(value, (VersionedList, VersionedDict)):
+        if parent is not None:
+            value._parents[id(parent)] = ref(parent)
+        if not value._checked:
+            # set first, so that a container that holds itself terminates
+            value._checked = True
+            version = value._version
+            for item in (value.values() if isinstance(value, VersionedDict) 
+                         else value):
+                item = _deep_version(item, value)
+                if item is None:
+                    value._checked = False
+                    return None
+                version = max(version, item)
+            value._version = version
+        return value._version
+    elif type(value) is tuple:
+        version = 0
+        for item in value:
+            item = _deep_version(item, parent)
+            if item is None:
+                return None
+            version = max(version, item)
+        return version
+    else:
+        return None
+
+
 class TypedValue:
     '''
     Wrap a value with a spec (and verify them).
+    
+    By default the value is verified immediately.  With ``verified=False`` 
+    it is verified on first access and then trusted.  With ``lazy=True`` it
+    is verified on access, but only if it has changed since it was last
+    verified; changes are detected within `VersionedList()`, 
+    `VersionedDict()`, tuples and atomic values (any other value is 
+    verified on every access).
+    
+      >>> tv = TypedValue(VersionedList([1, 2]), [int], lazy=True)
+      >>> tv.value
+      [1, 2]
+      >>> tv.value.append('three')
+      >>> tv.value
+      Traceback (most recent call last):
+        ...
+      TypeError: Type Seq(int) inconsistent with [1, 2, 'three'].
     '''
     
-    def __init__(self, value, spec, verified=True):
-        if verified:
+    def __init__(self, value, spec, verified=True, lazy=False):
+        self.__lazy = lazy
+        self.__version = None
+        if verified and not lazy:
             verify(value, spec)
             self.__verified = True
         else:
@@ -51,15 +203,23 @@ class TypedValue:
     
     @property
     def value(self):
-        if not self.__verified:
+        if self.__lazy:
+            version = deep_version(self.__value)
+            if version is None or version != self.__version:
+                verify(self.__value, self.__spec)
+                self.__version = version
+        elif not self.__verified:
             verify(self.__value, self.__spec)
             self.__verified = True
         return self.__value
     
     @value.setter
     def value(self, value):
-        verify(value, self.__spec)
-        self.__verified = True
+        if self.__lazy:
+            self.__version = None
+        else:
+            verify(value, self.__spec)
+            self.__verified = True
         self.__value = value
     
     def __repr__(self):
@@ -74,53 +234,116 @@ class TypedValue:
         
     
 class TypedProperty:
+    '''
+    A data descriptor for a typed attribute of a `Typed()` instance.  The
+    value is stored in the instance dictionary, under the same name, and
+    checked against the spec on assignment (an initial default is checked
+    when first read).
+    
+    Public methods on subclasses are available, bound to the current value
+    and spec, via the instance's `p` attribute (see `Typed()`); those whose
+    name starts with ``set_`` replace the value with their result.
+    '''
     
     def __init__(self, *args):
         if not args or len(args) > 2:
             raise TypeError('TypedProperty takes 1 or 2 arguments')
         try:
-            self.__value, self.__spec = args
+            self._default, self._spec = args
         except ValueError:
-            self.__value, self.__spec = (None, args[0])
-        self.__name = None
-            
-    def _install(self, target, name):
-        if self.__name:
-            assert name == self.__name
+            self._default, self._spec = (None, args[0])
+        self._name = None
+        self._validate = None
+        
+    def __set_name__(self, owner, name):
+        if self._name:
+            assert name == self._name
         else:
-            self.__name = name
-        tv = TypedValue(self.__value, self.__spec, verified=False)
-        def add(name, method):
-            if name.startswith('set_'):
-                def setter(*args, **kargs):
-                    tv.value = method(tv.value, tv.spec, *args, **kargs)
-                tv.__dict__[name] = setter
-            else:
-                tv.__dict__[name] = \
-                    lambda *args, **kargs: method(tv.value, tv.spec, *args, **kargs)
-        for (m_name, method) in items(self):
-            if not m_name.startswith('_'):
-                add(m_name, method)
-        target[name] = tv
+            self._name = name
+            
+    def _check(self, value):
+        # compiled on first use since the spec may be Delayed
+        if self._validate is None:
+            self._validate = validator(self._spec)
+        self._validate(value)
         
     def __get__(self, instance, type_=None):
-        if not instance:
+        if instance is None:
             raise ValueError('Only valid on instance')
-        #print('get', self.__name)
-        return getattr(getattr(instance, 'p'), self.__name).value
+        try:
+            return instance.__dict__[self._name]
+        except KeyError:
+            self._check(self._default)
+            instance.__dict__[self._name] = self._default
+            return self._default
     
     def __set__(self, instance, value):
-        if not instance:
+        if instance is None:
             raise ValueError('Only valid on instance')
-        #print('set', self.__name, value)
-        getattr(getattr(instance, 'p'), self.__name).value = value
+        self._check(value)
+        instance.__dict__[self._name] = value
 
 
-class _AsAttributes:
+class _BoundProperty:
+    '''
+    The value and spec of a `TypedProperty()` on a particular instance,
+    with the property's methods bound to them.
+    '''
+    
+    __slots__ = ('_instance', '_property')
     
-    def __init__(self, contents):
-        for (name, value) in contents.items():
-            setattr(self, name, value)
+    def __init__(self, instance, property_):
+        self._instance = instance
+        self._property = property_
+        
+    @property
+    def spec(self):
+        return self._property._spec
+    
+    @property
+    def value(self):
+        return self._property.__get__(self._instance)
+    
+    @value.setter
+    def value(self, value):
+        self._property.__set__(self._instance, value)
+        
+    def __repr__(self):
+        return 'BoundProperty(name={0!r}, value={1!r}, spec={2!r})'.format(
+            self._property._name, self.value, self.spec)
+        
+    def on(self, **choices):
+        return self.spec.on(self.value, **choices)
+    
+    def set_on(self, **choices):
+        self.value = self.spec.on(self.value, **choices)
+        
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        method = getattr(self._property, name)
+        if name.startswith('set_'):
+            def setter(*args, **kargs):
+                self.value = method(self.value, self.spec, *args, **kargs)
+            return setter
+        else:
+            return lambda *args, **kargs: \
+                method(self.value, self.spec, *args, **kargs)
+
+
+class _Properties:
+    
+    __slots__ = ('_instance',)
+    
+    def __init__(self, instance):
+        self._instance = instance
+        
+    def __getattr__(self, name):
+        for cls in type(self._instance).__mro__:
+            property_ = cls.__dict__.get(name)
+            if isinstance(property_, TypedProperty):
+                return _BoundProperty(self._instance, property_)
+        raise AttributeError(name)
 
 
 class Typed:
@@ -145,14 +368,13 @@ class Typed:
       Traceback (most recent call last):
         ...
       TypeError: Type str inconsistent with 2.
+      >>> c.p.a
+      BoundProperty(name='a', value=2, spec=<class 'int'>)
     '''
     
-    def __init__(self):
-        p = {}
-        for (name, value) in self.__class__.__dict__.items():
-            if isinstance(value, TypedProperty):
-                value._install(p, name)
-        setattr(self, 'p', _AsAttributes(p))
+    @property
+    def p(self):
+        return _Properties(self)
 
 
 class TypedDict(dict):
@@ -162,9 +384,16 @@ class TypedDict(dict):
     existing value checks the type first.  Deleting an entry removes any
     type information.
     
+    Values are stored directly; specs are held separately, and only for
+    typed entries, so untyped entries cost no more than in a `dict()`.
+    Instances have no ``__dict__`` (so attributes cannot be assigned), but
+    can be weakly referenced.
+    
     Since methods otherwise duplicate `dict()` the only way to access the
     type information is through the additional methods `typed_get()` and
-    `typed_items()`.
+    `typed_items()`.  These return new `TypedValue()` instances, so 
+    changing them does not change the dict (assign a `TypedValue()` to an
+    entry instead).
     
       >>> td = TypedDict(a=TypedValue('one', str), b=TypedValue(2, int))
       >>> len(td)
@@ -189,60 +418,125 @@ class TypedDict(dict):
       TypeError: Type str inconsistent with 2.
     '''
 
+    __slots__ = ('__specs', '__weakref__')
+
     def __init__(self, *args, **kargs):
+        self.__specs = {}
         self.update(*args, **kargs)
         
     def update(self, *args, **kargs):
+        '''
+        Update from a mapping or pairs (and keyword arguments) as for 
+        `dict()`.  New values are staged and checked together, grouped by 
+        spec, before any are stored, so a failed update leaves the 
+        contents unchanged.
+        '''
+        if len(args) > 1:
+            raise TypeError('update takes at most 1 positional argument')
+        values, specs, groups = {}, {}, {}
+        def stage(name, value):
+            if isinstance(value, TypedValue):
+                specs[name], value = value.spec, value.value
+            else:
+                spec = specs[name] if name in specs else self.__specs.get(name)
+                if spec is not None:
+                    try:
+                        groups.setdefault(spec, []).append(value)
+                    except TypeError: # unhashable
+                        verify(value, spec)
+            values[name] = value
         if args:
-            if len(args) > 1:
-                raise TypeError('update takes at most 1 positional argument')
             other = args[0]
-            try:
+            if isinstance(other, TypedDict):
+                # already checked against their own specs
+                for (name, value) in dict.items(other):
+                    spec = other.__specs.get(name)
+                    if spec is None:
+                        stage(name, value)
+                    else:
+                        specs[name] = spec
+                        values[name] = value
+            elif hasattr(other, 'typed_items'):
                 for (name, value) in other.typed_items():
-                    self[name] = value
-            except AttributeError:
-                try:
-                    for name in other.keys():
-                        self[name] = other[name]
-                except AttributeError:
-                    for (name, value) in other:
-                        self[name] = value
+                    stage(name, value)
+            elif hasattr(other, 'keys'):
+                for name in other.keys():
+                    stage(name, other[name])
+            else:
+                for (name, value) in other:
+                    stage(name, value)
         for name in kargs:
-            self[name] = kargs[name]
+            stage(name, kargs[name])
+        for (spec, group) in groups.items():
+            verify_column(group, spec)
+        super(TypedDict, self).update(values)
+        for (name, spec) in specs.items():
+            if spec is ANY:
+                self.__specs.pop(name, None)
+            else:
+                self.__specs[name] = spec
             
-    def __getitem__(self, name):
-        if name in self:
-            return super(TypedDict, self).__getitem__(name).value
-        else:
-            raise KeyError(name)
-
     def __setitem__(self, name, value):
         if isinstance(value, TypedValue):
-            super(TypedDict, self).__setitem__(name, value)
+            spec, value = value.spec, value.value
+            if spec is ANY:
+                self.__specs.pop(name, None)
+            else:
+                self.__specs[name] = spec
         else:
-            spec = self.typed_get(name).spec if name in self else ANY
-            super(TypedDict, self).__setitem__(name, TypedValue(value, spec))
+            spec = self.__specs.get(name)
+            if spec is not None:
+                _validator(spec)(value)
+        super(TypedDict, self).__setitem__(name, value)
 
-    def values(self):
-        for value in super(TypedDict, self).values():
-            yield value.value
-
-    def items(self):
-        for name in self.keys():
-            yield (name, self[name])
+    def __delitem__(self, name):
+        super(TypedDict, self).__delitem__(name)
+        self.__specs.pop(name, None)
+        
+    def clear(self):
+        super(TypedDict, self).clear()
+        self.__specs.clear()
+        
+    def popitem(self):
+        (name, value) = super(TypedDict, self).popitem()
+        self.__specs.pop(name, None)
+        return (name, value)
+    
+    def setdefault(self, name, default=None):
+        if name not in self:
+            self[name] = default
+        return self[name]
+    
+    def copy(self):
+        return self.__class__(self)
+    
+    def __reduce__(self):
+        # the specs must exist before any values are restored
+        return (self._restore, (dict(self), self.__specs))
+    
+    @classmethod
+    def _restore(cls, values, specs):
+        self = cls.__new__(cls)
+        self.__specs = dict(specs)
+        super(TypedDict, self).update(values)
+        return self
             
     def typed_items(self):
-        return super(TypedDict, self).items()
+        '''
+        Generate (name, `TypedValue()`) pairs.  The values are copies, so
+        changing them does not change the dict.
+        '''
+        for (name, value) in self.items():
+            yield (name, TypedValue(value, self.__specs.get(name, ANY), 
+                                    verified=False))
 
     __marker = object()
 
     def pop(self, name, default=__marker):
         if name in self:
-            try:
-                return self[name]
-            finally:
-                del self[name]
-        elif default != self.__marker:
+            self.__specs.pop(name, None)
+            return super(TypedDict, self).pop(name)
+        elif default is not self.__marker:
             return default
         else:
             raise KeyError(name)
@@ -250,15 +544,20 @@ class TypedDict(dict):
     def get(self, name, default=__marker):
         if name in self:
             return self[name]
-        elif default != self.__marker:
+        elif default is not self.__marker:
             return default
         else:
             raise KeyError(name)
 
     def typed_get(self, name, default=__marker):
+        '''
+        The entry as a `TypedValue()`.  This is a copy, so changing it does
+        not change the dict.
+        '''
         if name in self:
-            return super(TypedDict, self).get(name)
-        elif default != self.__marker:
+            return TypedValue(self[name], self.__specs.get(name, ANY), 
+                              verified=False)
+        elif default is not self.__marker:
             return default
         else:
             raise KeyError(name)
@@ -269,6 +568,22 @@ class TypedDict(dict):
         return '%s(%r)' % (self.__class__.__name__, sorted(list(self.typed_items()), key=str))
 
 
+_validators = {}
+
+def _validator(spec):
+    '''
+    A cached `validator()` for the given spec (specs are shared by many
+    keys, so compiling one per key would waste memory).
+    '''
+    try:
+        return _validators[spec]
+    except KeyError:
+        validate = _validators[spec] = validator(spec)
+        return validate
+    except TypeError: # unhashable
+        return validator(spec)
+
+
 if __name__ == "__main__":
     import doctest
     print(doctest.testmod())
@@ -26,11 +26,35 @@
 # above, a recipient may use your version of this file under either the
 # MPL or the LGPL License.
 
-from collections import OrderedDict
-from string import whitespace
+from array import array
+from collections import OrderedDict, Mapping, Sequence
+from copy import deepcopy
+from hashlib import sha1
+from importlib.util import MAGIC_NUMBER
+from io import StringIO
+from marshal import dumps as marshal_dumps, loads as marshal_loads
+from os import environ, makedirs, replace, stat, unlink
+from os.path import join
+from stat import S_IWGRP, S_IWOTH
+from sys import _getframe
+from tempfile import NamedTemporaryFile
+from threading import RLock
+from weakref import WeakValueDictionary
+from tokenize import generate_tokens, TokenError, NL, NEWLINE, COMMENT, \
+    ENDMARKER, OP, NAME as NAME_TOKEN
 
-from pytyp.spec.check import checked as _checked, verify as _verify
-from pytyp.spec.abcs import normalize, ANY
+try:
+    from os import getuid
+except ImportError: # windows
+    getuid = None
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from pytyp.spec.check import checked as _checked, verify_column, \
+    accepted_classes, validator
+from pytyp.spec.abcs import normalize, ANY, Seq, TSMeta
 import pytyp.spec.abcs as abcs
 
 
@@ -40,8 +64,31 @@ RESIZE = '__'
 class RecordException(TypeError): pass
 
 
+_record_cache_lock = RLock()
+_record_cache = OrderedDict() # least recently used first
+_record_cache_size = 1024
+_intern_lock = RLock()
+
+_cache_dir = environ.get('PYTYP_RECORD_CACHE')
+
+
+def set_cache_dir(directory):
+    '''
+    Set the directory used to store compiled record templates between 
+    processes (``None``, the default, disables the on-disk cache).  The 
+    initial value is taken from the ``PYTYP_RECORD_CACHE`` environment 
+    variable.
+    
+    Cached code is executed when records are defined, so the directory must
+    be trusted: it (and each file) is only used if owned by the current 
+    user and not writable by group or others.
+    '''
+    global _cache_dir
+    _cache_dir = directory
+
+
 def record(typename, field_names, verbose=False, mutable=False, checked=True,
-           context=None):
+           context=None, intern=False, module=None):
     '''
     This creates a wrapper around `dict` that allows attribute access.  In other
     words: it unifies `Rec()` and `Atr()`; it provides both __..item__ and __..attr__
@@ -60,6 +107,20 @@ def record(typename, field_names, verbose=False, mutable=False, checked=True,
     :param context: (default None) A ``dict`` that can provide access to additional
                     names used in ``field_names``.  The ``pytyp.spec.abcs`` module
                     is always available.
+    :param intern: (default False) If True (for immutable records only), equal
+                   instances (with values of the same types, at any depth) 
+                   are shared (via a table of weak references), so their
+                   hash is calculated once.  Only values of atomic types, 
+                   tuples, frozensets and immutable records can be shared;
+                   other instances are created as usual.
+    :param module: (default None) The module in which the class is defined,
+                   if not the caller's module (this is used when pickling).
+
+    Classes are cached, so repeated calls with the same arguments return the
+    same class (the 1024 most recently used classes are kept).  If a cache directory is given (see ``set_cache_dir()``) the
+    compiled class templates are also stored on disk, so that a new process
+    need not parse the field names or compile the template again (unless
+    a ``context`` is given, when the field names are parsed).
                     
     Here are some examples::
     
@@ -86,37 +147,192 @@ def record(typename, field_names, verbose=False, mutable=False, checked=True,
         >>> v = Variable(a=1,b=2,c=3)
         >>> len(v)
         3
+        
+    Many instances can be created together, from rows (mappings or tuples in
+    constructor order) or from columns.  Type checks are then made once per
+    column rather than once per instance::
+    
+        >>> Point = record('Point', 'x:int,y:int=0')
+        >>> Point._from_rows([(1, 2), {'x': 3}])
+        [{'x': 1, 'y': 2}, {'x': 3, 'y': 0}]
+        >>> Point._from_columns({'x': [1, 3], 'y': [2, 0]})
+        [{'x': 1, 'y': 2}, {'x': 3, 'y': 0}]
     '''
+    if intern and mutable:
+        raise TypeError('Cannot intern mutable records')
+    if module is None:
+        try:
+            module = _getframe(1).f_globals.get('__name__', '__main__')
+        except (AttributeError, ValueError):
+            pass
+    key = _cache_key(typename, field_names, mutable, checked, context, intern,
+                     module)
+    try:
+        hash(key)
+    except TypeError: # unhashable context
+        key = None
+    with _record_cache_lock:
+        cached = None if key is None else _record_cache.get(key)
+        if cached is None:
+            cached = _make_record(typename, field_names, mutable, checked,
+                                  context, intern, module)
+            if key is not None:
+                _record_cache[key] = cached
+                if len(_record_cache) > _record_cache_size:
+                    _record_cache.popitem(last=False)
+        else:
+            _record_cache.move_to_end(key)
+    (template, cls) = cached
+    if verbose: print(template)
+    return cls
+
+
+def _cache_key(typename, field_names, mutable, checked, context, intern,
+               module):
+    if context:
+        context = tuple(sorted(context.items(), key=lambda item: item[0]))
+    return (typename, field_names, mutable, checked, context, intern, module)
+
+
+def _make_record(typename, field_names, mutable, checked, context, intern,
+                 module=None):
     _context = dict(abcs.__dict__)
     if context: _context.update(context)
-    nsd = parse_args(field_names, _context)
-    template = class_template(typename, nsd, mutable, checked)
-    if verbose: print(template)
-    namespace = dict(property=property, checked=_checked, verify=_verify)
+    (template, code) = _template(typename, field_names, mutable, checked,
+                                 context, intern, _context)
+    namespace = dict(property=property, checked=_checked, validator=validator,
+                     rows_to_columns=rows_to_columns,
+                     check_columns=check_columns,
+                     columns_to_contents=columns_to_contents,
+                     InternMeta=InternMeta, intern_key=intern_key,
+                     WeakValueDictionary=WeakValueDictionary,
+                     intern_lock=_intern_lock, deepcopy=deepcopy,
+                     reduce_record=_reduce_record)
     namespace.update(_context)
+    namespace['__name__'] = module or __name__
+    exec(code, namespace)
+    cls = namespace[typename]
+    return (template, cls)
+
+
+def _reduce_record(record):
+    # imported here to avoid a circular dependency on serialisation
+    from pytyp.s11n.binary import reduce_record
+    return reduce_record(record)
+
+
+def _template(typename, field_names, mutable, checked, context, intern,
+              _context):
+    '''
+    The class template and its compiled code, using the on-disk cache (if
+    any).  Without a context, entries are keyed by the arguments, so that 
+    a cache hit also avoids parsing the field names; otherwise they are 
+    keyed by the template.  Keys include this module's source and the 
+    interpreter's bytecode version.
+    '''
+    path = None
+    if _cache_dir and not context and isinstance(field_names, str):
+        path = _cache_path(repr((typename, field_names, mutable, checked, intern)))
+        cached = _load(path)
+        if cached: return cached
+    nsd = parse_args(field_names, _context)
+    template = class_template(typename, nsd, mutable, checked, intern)
+    if _cache_dir and not path:
+        path = _cache_path(template)
+        cached = _load(path)
+        if cached: return cached
     try:
-        exec(template, namespace)
+        code = compile(template, '<record>', 'exec')
     except SyntaxError as e:
         raise SyntaxError(e.msg + ':\n\n' + template)
-    return namespace[typename]
+    if path: _save(path, (template, code))
+    return (template, code)
+
+
+_source_digest = []
+
+def _cache_path(text):
+    if not _source_digest:
+        try:
+            with open(__file__, 'rb') as input:
+                _source_digest.append(sha1(input.read()).digest())
+        except OSError:
+            _source_digest.append(b'')
+    digest = sha1(MAGIC_NUMBER + _source_digest[0] + text.encode('utf8'))
+    return join(_cache_dir, digest.hexdigest() + '.rec')
+
+
+def _load(path):
+    try:
+        with open(path, 'rb') as input:
+            if _trusted(_cache_dir) and _trusted(input.fileno()):
+                (template, code) = marshal_loads(input.read())
+                return (template, code)
+    except (OSError, EOFError, ValueError, TypeError):
+        pass
+
+
+def _save(path, value):
+    try:
+        makedirs(_cache_dir, mode=0o700, exist_ok=True)
+        output = NamedTemporaryFile(dir=_cache_dir, delete=False)
+    except OSError:
+        return
+    saved = False
+    try:
+        with output:
+            output.write(marshal_dumps(value))
+        replace(output.name, path)
+        saved = True
+    except OSError:
+        pass
+    finally:
+        if not saved:
+            try:
+                unlink(output.name)
+            except OSError:
+                pass
     
 
-def class_template(typename, nsd, mutable, checked):
+def _trusted(path):
+    '''
+    Is the file (or directory) owned by the current user and not writable by
+    anyone else?
+    '''
+    info = stat(path)
+    if getuid and info.st_uid != getuid():
+        return False
+    return not info.st_mode & (S_IWGRP | S_IWOTH)
+    
+
+def class_template(typename, nsd, mutable, checked, intern=False):
     pad4, pad8, pad12 = left(4), left(8), left(12)
     typespec = fmt_typespec(nsd)
     class_specs = '{' + ','.join(fmt_class_specs(nsd)) + '}'
+    class_defaults = '{' + ','.join(fmt_class_defaults(nsd)) + '}'
+    class_args = ''.join(map('{!r},'.format, fmt_class_args(nsd)))
+    class_fields = ''.join('{!r},'.format(name) for name in nsd if name != RESIZE)
+    columns_checked = bool(checked)
     class_doc = '\n'.join(map(pad8, fmt_init_args(nsd)))
     checked = '@checked' if checked else ''
-    verify = '\n'.join(map(pad8, fmt_verify(nsd, checked)))
+    missing = '\n'.join(map(pad12, fmt_missing(nsd)))
+    validate = '\n'.join(map(pad8, fmt_validate(checked)))
     init_args = ', '.join(fmt_init_args(nsd))
     init_set = '\n'.join(map(pad8, fmt_init_set(nsd)))
     immutable = '' if mutable else fmt_immutable()
-    return '''class {typename}(dict, {typespec}):
+    metaclass = ', metaclass=InternMeta' if intern else ''
+    interned = fmt_interned() if intern else ''
+    build = 'cls._intern(self)' if intern else 'self'
+    return '''class {typename}(dict, {typespec}{metaclass}):
     """
     record {typename}:
 {class_doc}
     """
     __specs = {class_specs}
+    __validators = dict((name, validator(spec)) for (name, spec) in __specs.items())
+    __defaults = {class_defaults}
+    __args = ({class_args})
+    _fields = ({class_fields})
     {checked}
     def __init__(self, {init_args}):
 {init_set}
@@ -124,28 +340,64 @@ def class_template(typename, nsd, mutable, checked):
         self._lock = None
     def __setitem__(self, name, value):
         if not {mutable}: raise TypeError('Immutable')
-        if name not in self.__specs and '__' not in self.__specs:
-            raise TypeError('Record {{}} does not exist'.format(name))
-{verify}            
-        super().__setitem__(name, value)
+        try:
+            validate = self.__validators[name]
+        except KeyError:
+{missing}
+{validate}
+        dict.__setitem__(self, name, value)
     def _replace(self, **kargs):
         state = dict(self)
         state.update(kargs)
         return {typename}(**state)
+    @classmethod
+    def _from_rows(cls, rows):
+        return cls._from_columns(cls._rows_to_columns(rows))
+    @classmethod
+    def _from_columns(cls, columns):
+        columns = cls._check_columns(columns)
+        return list(map(cls._build, columns_to_contents(columns)))
+    @classmethod
+    def _rows_to_columns(cls, rows):
+        return rows_to_columns(rows, cls.__args)
+    @classmethod
+    def _check_columns(cls, columns):
+        return check_columns(columns, cls.__specs, cls.__defaults,
+                             {columns_checked})
+    @classmethod
+    def _spec(cls, name):
+        return cls.__specs.get(name, cls.__specs.get('__'))
+    @classmethod
+    def _build(cls, contents):
+        self = dict.__new__(cls)
+        dict.__init__(self, contents)
+        self.__hash = []
+        self._lock = None
+        return {build}
+    def __copy__(self):
+        return self._build(dict(self))
+    def __deepcopy__(self, memo):
+        return self._build(deepcopy(dict(self), memo))
+    def __reduce_ex__(self, protocol):
+        return reduce_record(self)
     def __unpack(self, name):
         if name.startswith('_'):
             try: return int(name[1:])
             except: pass
         return name
     def __getattr__(self, name):
-        if name != '_lock' and hasattr(self, '_lock'):
-            return self.__getitem__(self.__unpack(name))
-        return super().__getattr__(name)
+        if name != '_lock' and '_lock' in self.__dict__:
+            try:
+                return self.__getitem__(self.__unpack(name))
+            except KeyError:
+                pass
+        raise AttributeError(name)
     def __setattr__(self, name, value):
-        if hasattr(self, '_lock'):
+        if '_lock' in self.__dict__:
             if not {mutable}: raise AttributeError('Immutable')
-            self.__setitem__(name, value)
-        super().__setattr__(name, value)
+            self.__setitem__(self.__unpack(name), value)
+        else:
+            super().__setattr__(name, value)
     def __delattr__(self, name):
         # could delete additional fields
         raise RecordException('Cannot delete from record')
@@ -162,7 +414,7 @@ def class_template(typename, nsd, mutable, checked):
         raise RecordException('Not supported in record')
     def update(self, *args):
         raise RecordException('Not supported in record')
-{immutable}'''.format(**locals())
+{immutable}{interned}'''.format(**locals())
 
 
 def left(n):
@@ -180,10 +432,71 @@ def fmt_immutable():
         return self.__hash[0]'''
     
 
-def fmt_verify(nsd, checked):
+def fmt_interned():
+    return '''
+    __interned = WeakValueDictionary()
+    @classmethod
+    def _intern(cls, self):
+        key = intern_key(self)
+        if key is None: # cannot be shared safely
+            return self
+        with intern_lock:
+            return cls.__interned.setdefault(key, self)
+    def __eq__(self, other):
+        if self is other:
+            return True
+        return super().__eq__(other)
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal'''
+
+
+_EXACT = (type(None), bool, int, float, complex, str, bytes)
+
+def intern_key(value):
+    '''
+    A key that is equal only for values of the same types (at any depth),
+    so that (eg) ``(1,)`` and ``(1.0,)`` are not shared, or ``None`` if no
+    such key is known for the value.
+    '''
+    type_ = type(value)
+    if type_ in _EXACT:
+        return (type_, value)
+    elif type_ in (tuple, frozenset):
+        keys = tuple(map(intern_key, value))
+        if None in keys:
+            return None
+        return (type_, keys if type_ is tuple else frozenset(keys))
+    elif isinstance(value, Mapping) and hasattr(type_, '_build') and \
+            type_.__hash__ is not None: # an immutable record
+        keys = frozenset((name, intern_key(item)) for (name, item) in value.items())
+        if any(key is None for (_, key) in keys):
+            return None
+        return (type_, keys)
+    else:
+        return None
+
+
+class InternMeta(TSMeta):
+    '''
+    The metaclass for interned records (construction returns the shared
+    instance).
+    '''
+    
+    def __call__(cls, *args, **kargs):
+        return cls._intern(super().__call__(*args, **kargs))
+    
+
+def fmt_missing(nsd):
+    if RESIZE in nsd:
+        yield "validate = self.__validators['__']"
+    else:
+        yield "raise TypeError('Record {} does not exist'.format(name))"
+
+
+def fmt_validate(checked):
     if checked:
-        yield "spec = self.__specs.get(name, self.__specs.get('__'))"
-        yield "verify(value, spec)"
+        yield "validate(value)"
 
 
 def fmt_typespec(nsd):
@@ -212,6 +525,21 @@ def fmt_class_specs(nsd):
             yield '{name!r}:{spec}'.format(**locals())
 
 
+def fmt_class_defaults(nsd):
+    for (name, (_, default)) in nsd.items():
+        if default is not None:
+            yield '{name!r}:{default}'.format(**locals())
+
+
+def fmt_class_args(nsd):
+    for (name, (_, default)) in nsd.items():
+        if default is None and name != RESIZE:
+            yield name
+    for (name, (_, default)) in nsd.items():
+        if default is not None and name != RESIZE:
+            yield name
+
+
 def to_arg(name):
     if isinstance(name, int):
         return '_' + str(name)
@@ -257,69 +585,403 @@ def fmt_properties(nsd, mutable):
                 yield 'def {arg}(self, value:{spec}): self[{name!r}] = value'.format(**locals())
         
         
+MISSING = object()
+
+
+def rows_to_columns(rows, args):
+    '''
+    Convert rows (mappings, or sequences in constructor order) to columns.
+    Absent values are marked as ``MISSING``.
+    '''
+    columns, count = OrderedDict((name, []) for name in args), 0
+    for row in rows:
+        if isinstance(row, Mapping):
+            for name in row:
+                if name not in columns:
+                    columns[name] = [MISSING] * count
+            for (name, column) in columns.items():
+                column.append(row.get(name, MISSING))
+        else:
+            row = tuple(row)
+            if len(row) > len(args):
+                raise RecordException('Too many values: {!r}'.format(row))
+            for (name, value) in zip(args, row):
+                columns[name].append(value)
+            for name in args[len(row):]:
+                columns[name].append(MISSING)
+            for name in columns:
+                if len(columns[name]) == count:
+                    columns[name].append(MISSING)
+        count += 1
+    return columns
+
+
+def check_columns(columns, specs, defaults, checked):
+    '''
+    Complete a mapping of columns with default values, checking each column
+    in one pass (if ``checked``).  Only additional (``__``) fields can then
+    contain ``MISSING`` values.
+    '''
+    columns = OrderedDict(columns)
+    lengths = set(map(len, columns.values()))
+    if len(lengths) > 1:
+        raise ValueError('Columns have different lengths')
+    count = lengths.pop() if lengths else 0
+    for name in columns:
+        if name not in specs and RESIZE not in specs:
+            raise TypeError('Record {} does not exist'.format(name))
+    for name in specs:
+        if name not in columns and name != RESIZE:
+            if not count: # no rows, so nothing is missing
+                columns[name] = []
+            elif name not in defaults:
+                raise TypeError('Missing value for {}'.format(name))
+            else:
+                columns[name] = [defaults[name]] * count
+    for (name, column) in list(columns.items()):
+        present = column
+        if MISSING in column:
+            if name in defaults:
+                column = [defaults[name] if value is MISSING else value 
+                          for value in column]
+                columns[name] = present = column
+            elif name in specs:
+                raise TypeError('Missing value for {}'.format(name))
+            else:
+                present = [value for value in column if value is not MISSING]
+        if checked:
+            verify_column(present, specs.get(name, specs.get(RESIZE)))
+    order = dict((name, index) for (index, name) in enumerate(specs))
+    return OrderedDict(sorted(columns.items(), 
+                              key=lambda item: order.get(item[0], len(order))))
+
+
+def columns_to_contents(columns):
+    '''
+    Generate the contents of records from (checked) columns.
+    '''
+    names = list(columns)
+    if not names:
+        return
+    for row in zip(*columns.values()):
+        if MISSING in row:
+            yield dict((name, value) for (name, value) in zip(names, row)
+                       if value is not MISSING)
+        else:
+            yield dict(zip(names, row))
+
+
 def parse_args(args, context):
     '''
     Parse a comma-separated list of
        name : spec = default
     triples, where all fields are optional, but the separators are required if
     the field to the right exists.
+    
+    The list is split with the Python tokenizer (in a single pass) and each
+    distinct spec is compiled and evaluated once.
+    '''
+    globals, specs = dict(context), {}
+    def evaluate(text, column):
+        if text not in specs:
+            try:
+                code = compile(text, '<record>', 'eval')
+            except SyntaxError as e:
+                syntax_error(args, column + (e.offset or 1) - 1, e.msg)
+            specs[text] = normalize(eval(code, globals))
+        return specs[text]
+    def each():
+        count = 0
+        for (name, spec, default) in split_args(args):
+            if name is None: # have numbered argument
+                (name, count) = (count, count + 1)
+            if spec is None:
+                spec = ANY
+            else:
+                spec = evaluate(*spec)
+            yield (name, (spec, default))
+    return OrderedDict(each())
+
+
+def syntax_error(args, column, reason='unexpected text'):
+    raise ValueError('Cannot parse: {}[{}] ({} at column {})'.format(
+            args[:column], args[column:], reason, column))
+
+
+def split_args(args):
     '''
-    open_to_close = {'(': ')', '[': ']', '{': '}', '"': '"', "'": "'"}
-    NO, OPEN, LEADING = 0, 1, 2
-    def each(args):
-        # trailing space at end catches trailing comma
-        count, used, c, args = 0, '', '', args.strip() + ' '
-        def syntax_error():
-            raise ValueError('Cannot parse: {}[{}]'.format(used, c+args))
-        while args:
-            parens, words, gap = [], [''], NO
-            while args:
-                used, c, args = used + c, args[0], args[1:]
-                if parens:
-                    if c == open_to_close[parens[-1]]:
-                        parens.pop()
-                    elif c in open_to_close:
-                        parens.append(c)
-                    words[-1] = words[-1] + c
+    Generate (name, (spec, column), default) for each field in ``args``, 
+    where missing values are ``None``.
+    '''
+    # wrap in parens so that newlines are not significant
+    source = '(' + args + ')'
+    starts = [0]
+    for line in source.splitlines(True):
+        starts.append(starts[-1] + len(line))
+    def offset(position):
+        (row, column) = position
+        return starts[row-1] + column
+    NAME, SPEC, DEFAULT = 0, 1, 2
+    def field():
+        (name, spec, default) = parts
+        if spec is not None:
+            spec = (source[spec[0]:spec[1]], spec[0] - 1)
+        if default is not None:
+            (start, default) = (default[0], source[default[0]:default[1]])
+            try: # reject (eg) two expressions
+                compile(default, '<default>', 'eval')
+            except SyntaxError as e:
+                syntax_error(args, start - 1 + (e.offset or 1) - 1, e.msg)
+        return (name, spec, default)
+    depth, part, parts = 0, NAME, [None, None, None]
+    try:
+        for token in generate_tokens(StringIO(source).readline):
+            (type_, text, start, end) = token[:4]
+            (start, end) = (offset(start), offset(end))
+            if type_ == COMMENT:
+                syntax_error(args, start - 1, 'comment')
+            if type_ in (NL, NEWLINE, ENDMARKER):
+                continue
+            if depth == 0:
+                if start: syntax_error(args, start - 1)
+                depth = 1
+                continue
+            if type_ == OP and text in (')', ']', '}'):
+                depth -= 1
+                if not depth:
+                    if part == DEFAULT and parts[part] is None:
+                        syntax_error(args, start - 1)
+                    yield field()
+                    continue
+            elif type_ == OP and text in ('(', '[', '{'):
+                depth += 1
+            elif depth == 1 and type_ == OP and text in (',', ':', '=', ':='):
+                if part == DEFAULT and parts[part] is None:
+                    syntax_error(args, start - 1)
+                if text == ',':
+                    yield field()
+                    part, parts = NAME, [None, None, None]
+                elif text == ':' and part == NAME:
+                    part = SPEC
+                elif text == '=' and part != DEFAULT:
+                    part = DEFAULT
+                elif text == ':=' and part == NAME:
+                    part = DEFAULT
                 else:
-                    if c == ',':
-                        break
-                    if c in whitespace:
-                        if gap is NO: gap = OPEN
-                    elif c == ':':
-                        if len(words) > 1: syntax_error()
-                        while len(words) < 2: words.append('')
-                        gap = LEADING
-                    elif c == '=':
-                        if len(words) > 2: syntax_error()
-                        while len(words) < 3: words.append('')
-                        gap = LEADING
-                    elif gap == OPEN:
-                        syntax_error()
-                    elif c in open_to_close:
-                        parens.append(c)
-                        words[-1] = words[-1] + c
-                        gap = NO
-                    else:
-                        words[-1] = words[-1] + c
-                        gap = NO
-            if parens:
-                syntax_error()
-            if words[0] == '': # have numbered argument
-                words[0] = count
-                count += 1 
-            if len(words) == 1: words.append('')
-            if words[1] == '':
-                words[1] = ANY
+                    syntax_error(args, start - 1)
+                continue
+            if part == NAME:
+                if parts[NAME] is not None or type_ != NAME_TOKEN:
+                    syntax_error(args, start - 1)
+                parts[NAME] = text
+            elif parts[part] is None:
+                parts[part] = [start, end]
             else:
-                globals = dict(context)
-                exec('spec=normalize(' + words[1] + ')', globals)
-                words[1] = globals['spec']
-            if len(words) == 2: words.append(None)
-            if words[2] == '': words[1] = None
-            if len(words) > 3: syntax_error()
-            yield tuple(words)
-    return OrderedDict((nsd[0], (nsd[1], nsd[2])) for nsd in each(args))    
+                parts[part][1] = end
+    except TokenError as e:
+        syntax_error(args, len(args), e.args[0])
+    except SyntaxError as e: # from tokenize in later versions of Python
+        syntax_error(args, min(len(args), max(0, (e.offset or 1) - 2)), e.msg)
+
+
+class RecordArray(Sequence):
+    '''
+    A sequence of records of a single class, stored as columns (numeric
+    columns use ``array.array``).  Indexing and iteration return light-weight
+    views that behave like the record, without creating a ``dict`` per row.
+    
+        >>> Point = record('Point', 'x:int,y:int=0')
+        >>> points = RecordArray.from_rows(Point, [(1, 2), (3, 4), (5,)])
+        >>> points[1].x
+        3
+        >>> points.column('y')
+        array('q', [2, 4, 0])
+        >>> [p.x for p in points.filter(lambda p: p.y > 1)]
+        [1, 3]
+        >>> isinstance(points, Seq(Point))
+        True
+        
+    :param record_class: A class created by ``record()``.
+    :param columns: A mapping from field names to sequences of values.  These
+                    are checked against the record's type specifications
+                    (if it is checked).
+    '''
+    
+    def __init__(self, record_class, columns=None):
+        self._record = record_class
+        columns = record_class._check_columns(columns or {})
+        self._columns = OrderedDict(
+            (name, to_column(values, record_class._spec(name)))
+            for (name, values) in columns.items())
+        self._length = len(next(iter(columns.values()))) if columns else 0
+        
+    @classmethod
+    def from_rows(cls, record_class, rows):
+        '''
+        Create an array from rows (mappings or sequences in constructor order).
+        '''
+        return cls(record_class, record_class._rows_to_columns(rows))
+    
+    @classmethod
+    def _from_checked(cls, record_class, columns, length):
+        result = cls.__new__(cls)
+        result._record, result._columns, result._length = \
+            record_class, columns, length
+        return result
+    
+    def __len__(self):
+        return self._length
+    
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self._from_checked(
+                self._record, 
+                OrderedDict((name, column[index]) 
+                            for (name, column) in self._columns.items()),
+                len(range(*index.indices(self._length))))
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError(index)
+        return RecordView(self, index)
+    
+    def __iter__(self):
+        for index in range(self._length):
+            yield RecordView(self, index)
+            
+    def __repr__(self):
+        return '{}({}, {})'.format(self.__class__.__name__, 
+                                   self._record.__name__, list(self._columns))
+            
+    def column(self, name):
+        '''
+        The values for the given field (``MISSING`` for absent ``__`` fields).
+        '''
+        return self._columns[name]
+    
+    def take(self, indices):
+        '''
+        A new array containing the rows at the given indices.
+        '''
+        indices = list(indices)
+        return self._from_checked(
+            self._record,
+            OrderedDict((name, to_column([column[i] for i in indices],
+                                         self._record._spec(name)))
+                        for (name, column) in self._columns.items()),
+            len(indices))
+    
+    def filter(self, predicate):
+        '''
+        A new array containing the rows for which ``predicate(row)`` is true.
+        '''
+        return self.take(index for index in range(self._length)
+                         if predicate(RecordView(self, index)))
+    
+    def where(self, name, predicate):
+        '''
+        A new array containing the rows for which ``predicate(value)`` is
+        true, where ``value`` is taken from the given column.
+        '''
+        return self.take(index for (index, value) 
+                         in enumerate(self._columns[name]) if predicate(value))
+    
+    def records(self):
+        '''
+        A list of (new) record instances.
+        '''
+        return list(map(self._record._build, columns_to_contents(self._columns)))
+    
+    def to_numpy(self, name):
+        '''
+        The given column as a NumPy array (if NumPy is installed).
+        '''
+        if numpy is None:
+            raise ImportError('Please install NumPy - eg pip install numpy')
+        return numpy.asarray(self._columns[name])
+    
+    def __seqhook__(self, spec):
+        '''
+        Check the contents against ``Seq(spec)`` as for a list of the 
+        records.  Records are not checked structurally, so this depends only
+        on the record class (and no rows are created).
+        '''
+        if not self._length:
+            return True
+        try:
+            return issubclass(self._record, spec)
+        except TypeError:
+            return all(isinstance(row, spec) for row in self.records())
+    
+    
+class RecordView(Mapping):
+    '''
+    A read-only view of one row in a ``RecordArray``.
+    '''
+    
+    __slots__ = ('_array', '_index')
+    
+    def __init__(self, array, index):
+        self._array = array
+        self._index = index
+        
+    def __getitem__(self, name):
+        value = self._array._columns[name][self._index]
+        if value is MISSING:
+            raise KeyError(name)
+        return value
+    
+    def __getattr__(self, name):
+        # slots are not set while copying or unpickling
+        if name in self.__slots__ or (name[:2] == '__' and name[-2:] == '__'):
+            raise AttributeError(name)
+        try:
+            return self[int(name[1:]) if name[:1] == '_' and name[1:].isdigit() 
+                        else name]
+        except KeyError:
+            raise AttributeError(name)
+        
+    def __iter__(self):
+        index = self._index
+        for (name, column) in self._array._columns.items():
+            if column[index] is not MISSING:
+                yield name
+    
+    def __len__(self):
+        return sum(1 for _ in self)
+    
+    def __hash__(self):
+        return hash(tuple(self.items()))
+    
+    def __repr__(self):
+        return repr(dict(self))
+    
+    def _record(self):
+        '''
+        A (new) record instance with the same contents.
+        '''
+        return self._array._record._build(dict(self))
+    
+    def __reduce__(self):
+        # copies (and pickles) are records, not views of the array
+        return (self._array._record._build, (dict(self),))
+    
+    def _replace(self, **kargs):
+        return self._record()._replace(**kargs)
+
+
+def to_column(values, spec):
+    '''
+    Store ``int`` and ``float`` values in arrays, everything else in a list.
+    '''
+    classes = accepted_classes(spec) if spec is not None else None
+    for (type_, code) in ((int, 'q'), (float, 'd')):
+        if classes == (type_,) and all(type(value) is type_ for value in values):
+            try:
+                return array(code, values)
+            except OverflowError:
+                pass
+    return list(values)
 
 
 if __name__ == "__main__":